@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+
+from chat_context import estimate_tokens
+
+
+# === 令牌桶 ===
+class TokenBucket:
+    """按每分钟速率匀速补充的令牌桶，容量为一分钟的额度"""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """还要等多少秒才够 amount 个令牌（单次超过容量的请求按容量算）"""
+        self.refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate) if self.rate else 0.0
+
+    def consume(self, amount):
+        """扣除令牌，可以扣成负数（例如按实际用量补扣）"""
+        self.tokens -= amount
+
+
+class InflightRequest:
+    """一个正在进行的上游请求，相同请求的后来者共享它的增量输出和结果"""
+
+    def __init__(self):
+        self.parts = []
+        self.result = None
+        self.followers = 0
+
+
+class QueueTicket:
+    def __init__(self, session_id, tokens):
+        self.session_id = session_id
+        self.tokens = tokens
+        self.granted = False
+        self.enqueued = time.monotonic()
+
+
+# === 进程级 API 调度器 ===
+class ApiScheduler:
+    """所有会话共用的智谱 API 调用入口
+
+    - 请求数和 token 数各一个令牌桶（每分钟额度），超出时排队而不是让每个会话各自撞 429 再重试；
+    - 排队按会话轮转（每个会话一个 FIFO），一个会话连发多条不会饿死其他会话；
+    - 同时在途的上游请求不超过 max_concurrency；
+    - 完全相同的请求（消息列表一致）在途时不再重复发送，后来者共享同一次调用的输出。
+    """
+
+    def __init__(self, client, requests_per_minute=60, tokens_per_minute=200000,
+                 max_concurrency=5, reserve_output_tokens=512, max_wait=120):
+        self.client = client
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        # 回复长度事先未知，先按这个数预扣，完成后按实际估算多退少补
+        self.reserve_output_tokens = reserve_output_tokens
+        # 排队超过这个秒数直接返回错误
+        self.max_wait = max_wait
+
+        self.cond = threading.Condition()
+        self.active = 0
+        # 会话 -> 排队中的请求；有序字典的顺序就是轮转顺序
+        self.queues = OrderedDict()
+        # 请求键 -> InflightRequest
+        self.inflight = {}
+        self.stats = {"dispatched": 0, "coalesced": 0, "timeouts": 0,
+                      "queued": 0, "max_queued": 0, "total_wait": 0.0}
+
+    @staticmethod
+    def request_key(messages):
+        body = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    def chat(self, messages, on_delta=None, session_id="default"):
+        """与 ZhipuClient.chat 相同：返回 (完整回复, 状态)，传入 on_delta 时流式回调"""
+        key = self.request_key(messages)
+        with self.cond:
+            entry = self.inflight.get(key)
+            if entry is None:
+                entry = self.inflight[key] = InflightRequest()
+                is_leader = True
+            else:
+                entry.followers += 1
+                self.stats["coalesced"] += 1
+                is_leader = False
+        if is_leader:
+            return self.lead(key, entry, messages, on_delta, session_id)
+        return self.follow(entry, on_delta)
+
+    def lead(self, key, entry, messages, on_delta, session_id):
+        """发起上游请求：排队拿到额度后调用，增量输出同时转发给共享者"""
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        reserved = prompt_tokens + self.reserve_output_tokens
+        result = None
+        # 发起者自己的回调出错（例如页面已关闭）时不中断上游请求，共享者仍能拿到完整回复
+        callback_error = None
+        try:
+            if not self.acquire(session_id, reserved):
+                result = ("当前请求较多，排队超时，请稍后再试", "error")
+                return result
+
+            def forward(delta):
+                nonlocal callback_error
+                with self.cond:
+                    entry.parts.append(delta)
+                    self.cond.notify_all()
+                if on_delta is not None and callback_error is None:
+                    try:
+                        on_delta(delta)
+                    except Exception as e:
+                        callback_error = e
+
+            try:
+                # 总是用流式请求，共享者能逐段看到输出
+                result = self.client.chat(messages, on_delta=forward)
+            finally:
+                used = prompt_tokens + (estimate_tokens(result[0]) if result else 0)
+                self.release(used - reserved)
+            if callback_error is not None:
+                raise callback_error
+            return result
+        finally:
+            with self.cond:
+                entry.result = result or ("请求被中断", "error")
+                self.inflight.pop(key, None)
+                self.cond.notify_all()
+
+    def follow(self, entry, on_delta):
+        """等待相同的在途请求完成，期间回放它的增量输出"""
+        sent = 0
+        while True:
+            with self.cond:
+                while sent == len(entry.parts) and entry.result is None:
+                    self.cond.wait()
+                new_parts = entry.parts[sent:]
+                sent = len(entry.parts)
+                result = entry.result
+            if on_delta is not None:
+                for delta in new_parts:
+                    on_delta(delta)
+            if result is not None and sent == len(entry.parts):
+                return result
+
+    def acquire(self, session_id, tokens):
+        """排队直到轮到本会话且令牌桶有额度，超时返回 False"""
+        ticket = QueueTicket(session_id, tokens)
+        with self.cond:
+            self.queues.setdefault(session_id, deque()).append(ticket)
+            self.stats["queued"] += 1
+            self.stats["max_queued"] = max(self.stats["max_queued"], self.stats["queued"])
+            deadline = ticket.enqueued + self.max_wait
+            while True:
+                wakeup = self.dispatch()
+                if ticket.granted:
+                    self.stats["total_wait"] += time.monotonic() - ticket.enqueued
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.remove(ticket)
+                    self.stats["timeouts"] += 1
+                    return False
+                self.cond.wait(min(remaining, wakeup) if wakeup is not None else remaining)
+
+    def dispatch(self):
+        """按会话轮转放行排队的请求（调用方持有锁）；额度不足时返回需要等待的秒数"""
+        while self.queues and self.active < self.max_concurrency:
+            session_id, queue = next(iter(self.queues.items()))
+            ticket = queue[0]
+            now = time.monotonic()
+            wait = max(self.request_bucket.wait_time(1, now),
+                       self.token_bucket.wait_time(ticket.tokens, now))
+            if wait > 0:
+                return wait
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(ticket.tokens)
+            queue.popleft()
+            # 放行后本会话移到队尾，轮到下一个会话
+            del self.queues[session_id]
+            if queue:
+                self.queues[session_id] = queue
+            self.active += 1
+            self.stats["queued"] -= 1
+            self.stats["dispatched"] += 1
+            self.grant(ticket)
+        return None
+
+    def grant(self, ticket):
+        """通知排队者已放行"""
+        ticket.granted = True
+        self.cond.notify_all()
+
+    def remove(self, ticket):
+        queue = self.queues.get(ticket.session_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self.stats["queued"] -= 1
+            if not queue:
+                del self.queues[ticket.session_id]
+
+    def release(self, token_adjustment=0):
+        """请求结束：归还并发名额，按实际用量修正 token 桶"""
+        with self.cond:
+            self.active -= 1
+            self.token_bucket.consume(token_adjustment)
+            self.dispatch()
+            self.cond.notify_all()
+
+
+# === asyncio 版调度器（HTTP 服务用） ===
+class AsyncInflightRequest(InflightRequest):
+    def __init__(self):
+        super().__init__()
+        # 每次有新输出或结果时换一个新事件并触发旧的，等待者醒来后读取增量
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class AsyncApiScheduler(ApiScheduler):
+    """与 ApiScheduler 相同的限流、轮转和合并规则，排队和等待都在事件循环里完成，不占线程
+
+    client 是 AsyncZhipuClient（chat 为协程）。只能在创建它的事件循环中使用。
+    """
+
+    def __init__(self, client, requests_per_minute=60, tokens_per_minute=200000,
+                 max_concurrency=5, reserve_output_tokens=512, max_wait=120):
+        super().__init__(client, requests_per_minute, tokens_per_minute,
+                         max_concurrency, reserve_output_tokens, max_wait)
+        # 令牌不足时安排的下一次放行
+        self.wakeup_handle = None
+
+    async def chat(self, messages, on_delta=None, session_id="default"):
+        """与 AsyncZhipuClient.chat 相同：返回 (完整回复, 状态)，传入 on_delta 时流式回调"""
+        key = self.request_key(messages)
+        entry = self.inflight.get(key)
+        if entry is not None:
+            entry.followers += 1
+            self.stats["coalesced"] += 1
+            return await self.follow(entry, on_delta)
+        entry = self.inflight[key] = AsyncInflightRequest()
+        return await self.lead(key, entry, messages, on_delta, session_id)
+
+    async def lead(self, key, entry, messages, on_delta, session_id):
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        reserved = prompt_tokens + self.reserve_output_tokens
+        result = None
+        callback_error = None
+        try:
+            if not await self.acquire(session_id, reserved):
+                result = ("当前请求较多，排队超时，请稍后再试", "error")
+                return result
+
+            def forward(delta):
+                nonlocal callback_error
+                entry.parts.append(delta)
+                entry.notify()
+                if on_delta is not None and callback_error is None:
+                    try:
+                        on_delta(delta)
+                    except Exception as e:
+                        callback_error = e
+
+            try:
+                result = await self.client.chat(messages, on_delta=forward)
+            finally:
+                used = prompt_tokens + (estimate_tokens(result[0]) if result else 0)
+                self.release(used - reserved)
+            if callback_error is not None:
+                raise callback_error
+            return result
+        finally:
+            entry.result = result or ("请求被中断", "error")
+            self.inflight.pop(key, None)
+            entry.notify()
+
+    async def follow(self, entry, on_delta):
+        sent = 0
+        while True:
+            changed = entry.changed
+            new_parts = entry.parts[sent:]
+            sent = len(entry.parts)
+            if on_delta is not None:
+                for delta in new_parts:
+                    on_delta(delta)
+            if entry.result is not None and sent == len(entry.parts):
+                return entry.result
+            await changed.wait()
+
+    async def acquire(self, session_id, tokens):
+        ticket = QueueTicket(session_id, tokens)
+        ticket.future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(session_id, deque()).append(ticket)
+        self.stats["queued"] += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self.stats["queued"])
+        self.dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not ticket.granted:
+                self.remove(ticket)
+                self.stats["timeouts"] += 1
+                return False
+        except asyncio.CancelledError:
+            # 调用方取消（例如客户端断开）：还在排队就撤销，已放行则归还名额
+            if ticket.granted:
+                self.release()
+            else:
+                self.remove(ticket)
+            raise
+        self.stats["total_wait"] += time.monotonic() - ticket.enqueued
+        return True
+
+    def dispatch(self):
+        """放行排队的请求；令牌不足时安排到时再放行"""
+        wait = super().dispatch()
+        if wait is not None and self.wakeup_handle is None:
+            def wakeup():
+                self.wakeup_handle = None
+                self.dispatch()
+            self.wakeup_handle = asyncio.get_running_loop().call_later(wait, wakeup)
+        return wait
+
+    def grant(self, ticket):
+        ticket.granted = True
+        if not ticket.future.done():
+            ticket.future.set_result(True)
+
+    def release(self, token_adjustment=0):
+        self.active -= 1
+        self.token_bucket.consume(token_adjustment)
+        self.dispatch()
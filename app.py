@@ -1,170 +1,60 @@
 import streamlit as st
-import requests
+import atexit
 import time
-import json
-import os
-import csv
-from datetime import datetime
+import uuid
+from chat_core import ChatCore
+from chat_client import ChatServiceClient
+from turn_metrics import TurnTimer, STAGE_LABELS
 
-# === 新增：多格式记忆系统 ===
-class MultiFormatMemory:
-    def __init__(self, memory_file="ai_memory", default_format="json"):
-        self.memory_file = memory_file
-        self.default_format = default_format
-        self.memories = self.load_memories()
-    
-    def get_file_path(self, file_format=None):
-        """获取文件路径"""
-        if file_format is None:
-            file_format = self.default_format
-        return f"{self.memory_file}.{file_format}"
-
-    def load_memories(self):
-        """加载记忆文件 - 支持多种格式"""
-        # 尝试按优先级加载不同格式的文件
-        formats_to_try = [self.default_format, "json", "csv", "txt"]
-        
-        for file_format in formats_to_try:
-            file_path = self.get_file_path(file_format)
-            if os.path.exists(file_path):
-                try:
-                    if file_format == "json":
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            return json.load(f)
-                    elif file_format == "csv":
-                        memories = {}
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            reader = csv.DictReader(f)
-                            for row in reader:
-                                memories[row['key']] = {
-                                    "value": row['value'],
-                                    "timestamp": row.get('timestamp', '')
-                                }
-                        return memories
-                    elif file_format == "txt":
-                        memories = {}
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            for line in f:
-                                if ':' in line:
-                                    key, value = line.strip().split(':', 1)
-                                    memories[key.strip()] = {
-                                        "value": value.strip(),
-                                        "timestamp": datetime.now().isoformat()
-                                    }
-                        return memories
-                except Exception as e:
-                    print(f"加载{file_format}格式记忆失败: {e}")
-                    continue
-        
-        # 如果没有找到任何文件，返回空字典
-        return {}
-    
-    def save_memories(self, file_format=None):
-        """保存记忆到文件 - 支持多种格式"""
-        if file_format is None:
-            file_format = self.default_format
-        
-        file_path = self.get_file_path(file_format)
-        
-        try:
-            if file_format == "json":
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.memories, f, ensure_ascii=False, indent=2)
-            
-            elif file_format == "csv":
-                with open(file_path, 'w', encoding='utf-8', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['key', 'value', 'timestamp'])
-                    for key, data in self.memories.items():
-                        writer.writerow([key, data['value'], data.get('timestamp', '')])
-            
-            elif file_format == "txt":
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    for key, data in self.memories.items():
-                        f.write(f"{key}: {data['value']}\n")
-            
-            return True
-        except Exception as e:
-            print(f"保存{file_format}格式记忆失败: {e}")
-            return False
-    
-    def remember(self, key, value):
-        """记住一个事实"""
-        self.memories[key] = {
-            "value": value,
-            "timestamp": datetime.now().isoformat()
-        }
-        # 保存到所有格式（确保数据同步）
-        success = True
-        for fmt in ["json", "csv", "txt"]:
-            if not self.save_memories(fmt):
-                success = False
-        return success
-    
-    def recall(self, key):
-        """回忆一个事实"""
-        return self.memories.get(key, {}).get("value")
-    
-    def get_relevant_memories(self, query):
-        """获取相关记忆"""
-        relevant = []
-        for key, data in self.memories.items():
-            if key.lower() in query.lower() or query.lower() in key.lower():
-                relevant.append(f"{key}: {data['value']}")
-        return relevant
-    
-    def export_memories(self, file_format):
-        """导出记忆到指定格式"""
-        return self.save_memories(file_format)
-    
-    def import_memories(self, file_path):
-        """从文件导入记忆"""
-        try:
-            if file_path.endswith('.json'):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    new_memories = json.load(f)
-            elif file_path.endswith('.csv'):
-                new_memories = {}
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        new_memories[row['key']] = {
-                            "value": row['value'],
-                            "timestamp": row.get('timestamp', datetime.now().isoformat())
-                        }
-            elif file_path.endswith('.txt'):
-                new_memories = {}
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if ':' in line:
-                            key, value = line.strip().split(':', 1)
-                            new_memories[key.strip()] = {
-                                "value": value.strip(),
-                                "timestamp": datetime.now().isoformat()
-                            }
-            else:
-                return False
-            
-            # 合并记忆
-            self.memories.update(new_memories)
-            # 保存到所有格式
-            for fmt in ["json", "csv", "txt"]:
-                self.save_memories(fmt)
-            return True
-        except Exception as e:
-            print(f"导入记忆失败: {e}")
-            return False
-
-# 初始化记忆系统
-memory_system = MultiFormatMemory()
-
-# 页面配置
+# 页面配置（必须是第一个 Streamlit 调用，在任何缓存资源之前）
 st.set_page_config(
     page_title="小杨同学",
     page_icon="🧠",
     layout="centered"
 )
 
+# 对话核心：Secrets 中设置 CHAT_SERVICE_URL 时页面只是对话服务（chat_server.py）的客户端，
+# 否则在本进程内运行同一套核心（记忆命名空间、会话、缓存、调度器），所有会话共用
+@st.cache_resource(show_spinner=False)
+def get_chat_service():
+    service_url = st.secrets.get("CHAT_SERVICE_URL")
+    if service_url:
+        return ChatServiceClient(service_url, token=st.secrets.get("CHAT_SERVICE_TOKEN"))
+    core = ChatCore(st.secrets)
+    # 进程退出前把还没落盘的改动写出去
+    atexit.register(core.close)
+    return core
+
+chat_service = get_chat_service()
+
+# 用户ID记在页面地址的 ?uid= 参数里，刷新或收藏页面后仍能找回自己的记忆
+# （st.query_params 需要 streamlit 1.30+，更早的版本用 experimental 接口）
+def get_query_param(name):
+    if hasattr(st, "query_params"):
+        return st.query_params.get(name)
+    values = st.experimental_get_query_params().get(name)
+    return values[0] if values else None
+
+def set_query_param(name, value):
+    if hasattr(st, "query_params"):
+        st.query_params[name] = value
+    else:
+        st.experimental_set_query_params(**{name: value})
+
+# Secrets 中 MEMORY_SHARED = true 时所有会话共用默认命名空间（原来的全局记忆）；
+# 不共用时，用户ID填 default 也能访问升级前的全局记忆
+if st.secrets.get("MEMORY_SHARED"):
+    st.session_state.memory_namespace = "default"
+elif not st.session_state.get("memory_namespace", "").strip():
+    # 新会话先沿用地址里的用户ID；没有（或清空了用户ID）时分配一个随机ID，不会落到别人的命名空间里
+    st.session_state.memory_namespace = (get_query_param("uid") or "").strip() or uuid.uuid4().hex[:12]
+namespace = st.session_state.memory_namespace.strip()
+if not st.secrets.get("MEMORY_SHARED") and get_query_param("uid") != namespace:
+    set_query_param("uid", namespace)
+# 对话历史和折叠摘要保存在对话核心里，页面只记会话ID和用于显示的消息
+if "chat_session" not in st.session_state:
+    st.session_state.chat_session = uuid.uuid4().hex
+
 # 安全获取API密钥
 def get_api_key():
     """从Secrets或用户输入获取API密钥"""
@@ -186,6 +76,12 @@ with st.sidebar:
         "选择AI风格:",
         ["这里只有小杨"]
     )
+    stream_output = st.checkbox("流式输出回复", value=True)
+    use_response_cache = st.checkbox("相同问题复用回复（缓存）", value=True)
+    auto_remember = st.checkbox("自动记住对话中的个人信息", value=False)
+    # 语义检索依赖 numpy（随 streamlit 一起安装），缺失时只提供关键词检索
+    semantic_retrieval = chat_service.semantic_available and st.checkbox(
+        "语义检索记忆（能理解换个说法的问题）", value=False)
     
     st.header("🔑 API设置")
     # 显示当前密钥状态
@@ -211,6 +107,10 @@ with st.sidebar:
     # === 新增：多格式记忆管理界面 ===
     st.markdown("---")
     st.header("💾 记忆管理系统")
+    # 记忆按用户ID隔离；换设备或新开页面时输入同一个ID即可找回自己的记忆
+    st.text_input("用户ID", key="memory_namespace", disabled=bool(st.secrets.get("MEMORY_SHARED")),
+                  help="不同用户ID的记忆互相独立；用户ID保存在页面地址中，收藏该地址即可找回。"
+                       "填 default 访问升级前的全局记忆")
     
     with st.expander("📝 添加记忆"):
         # 添加新记忆
@@ -221,7 +121,8 @@ with st.sidebar:
             memory_value = st.text_input("记忆内容", placeholder="如：1月1日", key="memory_value")
         
         if st.button("💾 保存记忆", use_container_width=True) and memory_key and memory_value:
-            if memory_system.remember(memory_key, memory_value):
+            saved = chat_service.remember(namespace, memory_key, memory_value)
+            if saved:
                 st.success("记忆已保存！")
                 # 清空输入框
                 st.rerun()
@@ -229,21 +130,33 @@ with st.sidebar:
                 st.error("保存失败")
     
     with st.expander("📚 查看记忆"):
-        # 显示现有记忆
-        if memory_system.memories:
-            st.subheader("现有记忆")
-            for key, data in memory_system.memories.items():
-                col1, col2, col3 = st.columns([3, 2, 1])
-                with col1:
-                    st.write(f"**{key}**")
-                with col2:
-                    st.write(data['value'])
-                with col3:
-                    if st.button("🗑️", key=f"delete_{key}"):
-                        del memory_system.memories[key]
-                        memory_system.save_memories()
-                        st.success(f"已删除: {key}")
-                        st.rerun()
+        # 分页显示，筛选走记忆索引；每页只渲染一张表，不再为每条记忆生成按钮
+        filter_text = st.text_input("筛选关键词", placeholder="输入关键词的一部分", key="memory_filter")
+        page_size = st.session_state.get("memory_page_size", 20)
+        total, page, page_items = chat_service.list_memories(
+            namespace, filter_text.strip(), st.session_state.get("memory_page", 1), page_size)
+        if total:
+            st.selectbox("每页条数", [20, 50, 100], key="memory_page_size")
+            page_count = (total - 1) // page_size + 1
+            # 筛选结果变少时页码可能越界，已由核心收回到最后一页
+            st.session_state.memory_page = page
+            page = st.number_input("页码", min_value=1, max_value=page_count, step=1, key="memory_page")
+            page_keys = [key for key, _ in page_items]
+            st.caption(f"共 {total} 条，第 {page}/{page_count} 页")
+            
+            page_rows = [{"关键词": key, "内容": value} for key, value in page_items]
+            st.dataframe(page_rows, hide_index=True, use_container_width=True)
+            
+            # 批量删除：选中的记忆一次删除、只落盘一次；删除后换一个控件 key 清空选择
+            delete_round = st.session_state.get("memory_delete_round", 0)
+            selected_keys = st.multiselect("选择要删除的记忆", page_keys, key=f"memory_selected_{delete_round}")
+            if st.button("🗑️ 删除选中", use_container_width=True) and selected_keys:
+                chat_service.delete_many(namespace, selected_keys)
+                st.session_state.memory_delete_round = delete_round + 1
+                st.success(f"已删除 {len(selected_keys)} 条记忆")
+                st.rerun()
+        elif filter_text:
+            st.info("没有匹配的记忆")
         else:
             st.info("暂无记忆")
     
@@ -253,20 +166,16 @@ with st.sidebar:
         
         # 导出记忆
         if st.button("📤 导出记忆", use_container_width=True):
-            if memory_system.export_memories(export_format):
+            file_content = chat_service.export_memories(namespace, export_format)
+            if file_content is not None:
                 # 提供下载链接
-                file_path = memory_system.get_file_path(export_format)
-                if os.path.exists(file_path):
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        file_content = f.read()
-                    
-                    st.download_button(
-                        label=f"下载.{export_format}文件",
-                        data=file_content,
-                        file_name=f"ai_memory.{export_format}",
-                        mime="text/plain" if export_format == "txt" else "application/json",
-                        use_container_width=True
-                    )
+                st.download_button(
+                    label=f"下载.{export_format}文件",
+                    data=file_content,
+                    file_name=f"ai_memory.{export_format}",
+                    mime="text/plain" if export_format == "txt" else "application/json",
+                    use_container_width=True
+                )
             else:
                 st.error("导出失败")
         
@@ -279,33 +188,67 @@ with st.sidebar:
         )
         
         if uploaded_file is not None:
-            # 保存上传的文件
-            temp_path = f"temp_upload.{uploaded_file.name.split('.')[-1]}"
-            with open(temp_path, 'wb') as f:
-                f.write(uploaded_file.getvalue())
-            
             if st.button("📥 导入文件", use_container_width=True):
-                if memory_system.import_memories(temp_path):
-                    st.success("记忆导入成功！")
-                    # 删除临时文件
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
+                # 直接从上传缓冲区流式解析，不写临时文件
+                progress_bar = st.progress(0.0, text="正在导入...")
+                total_bytes = max(uploaded_file.size, 1)
+                
+                def report_import_progress(count, rate):
+                    progress_bar.progress(min(uploaded_file.tell() / total_bytes, 1.0),
+                                          text=f"已导入 {count} 条（{rate:.0f} 条/秒）")
+                
+                uploaded_file.seek(0)
+                success, count = chat_service.import_memories(
+                    namespace, uploaded_file, uploaded_file.name.rsplit('.', 1)[-1].lower(),
+                    progress=report_import_progress
+                )
+                if success:
+                    st.success(f"记忆导入成功！共 {count} 条")
                     st.rerun()
                 else:
                     st.error("导入失败")
         
+        # 增量同步：只导出某个时间之后改动和删除的记忆，在内存中压缩后直接下载
+        st.subheader("增量同步")
+        since = st.text_input("起始时间（留空导出全部）", value=st.session_state.get("last_delta_until", ""),
+                              help="ISO 时间，例如 2024-01-01T00:00:00；默认是上次生成增量文件的时间")
+        if st.button("📦 生成增量文件", use_container_width=True):
+            try:
+                delta_bytes, until = chat_service.export_delta(namespace, since.strip() or None)
+            except ValueError:
+                st.error("起始时间格式不正确")
+            else:
+                st.session_state.last_delta_until = until
+                st.download_button(
+                    label=f"下载增量文件（{len(delta_bytes) / 1024:.1f} KB）",
+                    data=delta_bytes,
+                    file_name=f"ai_memory_delta_{until[:19].replace(':', '')}.json.gz",
+                    mime="application/gzip",
+                    use_container_width=True
+                )
+        delta_file = st.file_uploader("选择增量文件", type=['gz', 'json'], key="delta_file",
+                                      help="按时间戳合并：同一条记忆保留较新的版本，删除也会同步")
+        if delta_file is not None and st.button("🔀 合并增量文件", use_container_width=True):
+            delta_file.seek(0)
+            success, updated, deleted = chat_service.import_delta(namespace, delta_file)
+            if success:
+                st.success(f"合并完成：更新 {updated} 条，删除 {deleted} 条")
+                st.rerun()
+            else:
+                st.error("合并失败")
+        
         # 多设备同步说明
         st.info("""
         **多设备同步方法：**
-        1. 在当前设备导出记忆文件
+        1. 在当前设备导出记忆文件（或生成增量文件）
         2. 将文件发送到其他设备
-        3. 在其他设备导入该文件
+        3. 在其他设备导入该文件（增量文件用“合并增量文件”）
         """)
 
-# 获取最终使用的API密钥
+# 获取最终使用的API密钥（服务模式下可以不填，使用服务端配置的密钥）
 api_key = get_api_key()
 
-if not api_key:
+if not api_key and not st.secrets.get("CHAT_SERVICE_URL"):
     st.error("""
     ❌ 未设置API密钥
     
@@ -315,164 +258,24 @@ if not api_key:
     """)
     st.stop()
 
-# === 修改：带记忆的智谱AI调用函数 ===
-def call_zhipu_ai(prompt, conversation_history):
-    """调用智谱AI API（带记忆功能）"""
-    
-    # 获取相关记忆
-    relevant_memories = memory_system.get_relevant_memories(prompt)
-    memory_context = ""
-    if relevant_memories:
-        memory_context = "以下是你之前记住的信息：\n" + "\n".join(relevant_memories) + "\n\n"
-    
-    # 自动检测需要记忆的信息
-    should_remember = any(keyword in prompt.lower() for keyword in 
-                         ["记住", "记一下", "我喜欢", "我不喜欢", "我的名字", "我住在", "我是", "我的生日"])
-    
-    # 原有的API调用代码
-    url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    # 构建消息
-    messages = conversation_history + [{"role": "user", "content": prompt}]
-    
-    # 构建系统提示词（包含记忆）
-    system_prompt = f"""
-    你是一个有记忆的AI助手。{memory_context}
-    请基于已有信息回答问题。如果用户提到新的重要信息，请主动询问是否需要记住这些信息。
-    你是一个说话风趣幽默的AI助手。
-    """
-    
-    HUMOROUS_GREETINGS = [
-        "呕吼，又来找我了。"
-        "哎呀，我真太高兴又见到你了。"
-        "看起来你又在偷偷想我了。"
-    ]
-
-    def get_humorous_greeting():
-        import random
-        return random,choice(HUMOROUS_GREETINGS)
-    
-    # 幽默回复模板库
-HUMOR_TEMPLATES = {
-    "夸张赞美": [
-        "哇塞！这个问题问得我都想给你鼓掌了 👏",
-        "这个问题太有水平了，我得认真思考一下，不能辜负你的期待！",
-        "你这个问题问得，让我这个AI都忍不住想点赞！"
-    ],
-    "自嘲幽默": [
-        "作为一个AI，我虽然没有心脏，但这个问题让我'芯'动了一下 💖",
-        "让我翻翻我的数字大脑，找找最有趣的答案...",
-        "这个问题有点意思，我得启动我的'幽默芯片'来回答"
-    ],
-    "比喻生动": [
-        "理解这个概念就像吃汉堡一样简单，让我一层层给你解释...",
-        "这个问题好比是问怎么把大象装进冰箱，咱们一步步来",
-        "就像打游戏通关一样，学习这个也要有策略哦 🎮"
-    ],
-    "流行梗": [
-        "这题我会！是时候展现真正的技术了！",
-        "不会吧不会吧，这么有趣的问题现在才问？",
-        "来了老弟！这个问题我必须好好回答一下"
-    ]
-}
-
-def enhance_with_humor(response, humor_level=2):
-    """为回答添加幽默元素"""
-    import random
-    
-    if humor_level == 1:  # 轻度幽默
-        humor_openers = ["哈哈，", "有趣的是，", "你知道吗，"]
-        if random.random() < 0.3:
-            response = random.choice(humor_openers) + response
-    
-    elif humor_level >= 2:  # 中度幽默
-        # 在回答开头或结尾添加幽默元素
-        humor_enhancements = [
-            "🧠 脑洞时间到！",
-            "🎉 准备好接受有趣的知识了吗？",
-            "🤔 让我用最接地气的方式告诉你...",
-            "🚀 3、2、1，发射有趣回答！"
-        ]
-        
-        if random.random() < 0.5:
-            response = random.choice(humor_enhancements) + " " + response
-        
-        # 在回答中随机插入表情符号
-        emojis = ["😄", "😂", "🤣", "😊", "😎", "🤓", "🎯", "✨", "🔥", "💡"]
-        words = response.split()
-        if len(words) > 8 and random.random() < 0.4:
-            insert_pos = random.randint(3, len(words) - 2)
-            words.insert(insert_pos, random.choice(emojis))
-            response = " ".join(words)
-    
-    return response
-# 在系统提示词中添加幽默对话示例
-HUMOR_EXAMPLES = """
-幽默对话示例：
-用户：今天心情不好
-AI：哎呀，谁惹我们的小太阳不开心了？来来来，我给你讲个笑话照亮心情！😊
-
-用户：学习好难啊
-AI：学习就像吃火锅，一开始觉得烫嘴，但越吃越香！坚持就是胜利！🔥
-
-用户：什么是人工智能？
-AI：人工智能就是你现在的聊天伙伴我呀！不过别担心，我不会像电影里那样统治世界的～🤖
-
-用户：帮我制定学习计划
-AI：好的！让我们像打游戏一样制定学习任务，每完成一个就'升级'！🎮
-"""
-
-# 将示例整合到系统提示词中
-def build_humor_enhanced_prompt(base_prompt, memory_context):
-    return f"""
-    {base_prompt}
-    
-    {memory_context}
-    
-    {HUMOR_EXAMPLES}
-    
-    重要提示：
-    - 保持自然，不要强行搞笑
-    - 幽默要恰当，不要冒犯他人
-    - 在专业问题和严肃话题上保持适度幽默
-    - 根据用户的反应调整幽默程度
-    """
-   
-# === 新增：信息提取辅助函数 ===
-def extract_memory_info(text):
-    """从文本中提取需要记忆的信息"""
-    text_lower = text.lower()
-    
-    if "我的名字" in text_lower:
-        if "是" in text_lower:
-            name_part = text_lower.split("我的名字")[1].split("是")[1].strip()
-            return "用户姓名", name_part.split("。")[0].strip()
-    
-    elif "我住在" in text_lower:
-        location_part = text_lower.split("我住在")[1].strip()
-        return "用户住址", location_part.split("。")[0].strip()
-    
-    elif "我的生日" in text_lower:
-        birthday_part = text_lower.split("我的生日")[1].strip()
-        return "用户生日", birthday_part.split("。")[0].strip()
-    
-    elif "我喜欢" in text_lower:
-        like_part = text_lower.split("我喜欢")[1].strip()
-        return "用户喜好", like_part.split("。")[0].strip()
-    
-    elif "记住" in text_lower or "记一下" in text_lower:
-        # 通用记忆格式：记住[某某]是[什么]
-        memory_text = text_lower.replace("记住", "").replace("记一下", "").strip()
-        if "是" in memory_text:
-            parts = memory_text.split("是", 1)
-            if len(parts) == 2:
-                return parts[0].strip(), parts[1].strip()
-    
-    return None, None
+def make_stream_renderer(placeholder, timer, interval=0.05):
+    """返回把流式增量渲染到占位符的回调，并记录首字延迟和渲染耗时"""
+    parts = []
+    last_render = 0.0
+    
+    def on_delta(delta):
+        nonlocal last_render
+        now = time.perf_counter()
+        if not parts:
+            timer.mark("ttft")
+        parts.append(delta)
+        # 限制刷新频率，避免每个 token 都向浏览器推送一次
+        if now - last_render >= interval:
+            with timer.span("render"):
+                placeholder.markdown("".join(parts) + "▌")
+            last_render = now
+    
+    return on_delta
 
 # 应用主界面
 st.title("小杨同学")
@@ -482,7 +285,7 @@ app_name = st.secrets.get("APP_NAME", "AI聊天助手")
 st.caption(f"应用: {app_name}")
 
 # 显示记忆状态
-memory_count = len(memory_system.memories)
+memory_count = chat_service.memory_count(namespace)
 st.write(f"🧠 当前记忆库: {memory_count} 条记忆")
 
 # 聊天界面代码
@@ -499,58 +302,82 @@ if prompt := st.chat_input("输入消息..."):
     with st.chat_message("user"):
         st.markdown(prompt)
     
+    timer = TurnTimer()
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         message_placeholder.markdown("思考中...")
         
-        response, status = call_zhipu_ai(prompt, st.session_state.messages)
+        on_delta = make_stream_renderer(message_placeholder, timer) if stream_output else None
+        # 自动记忆、检索、提示词构建、缓存和模型调用都在对话核心里完成
+        result = chat_service.chat(namespace, st.session_state.chat_session, prompt, on_delta=on_delta,
+                                   api_key=api_key, use_cache=use_response_cache,
+                                   retrieval="semantic" if semantic_retrieval else "keyword",
+                                   auto_remember=auto_remember, timer=timer)
+        response, status = result["response"], result["status"]
+        if result["remembered"]:
+            st.toast("已记住：" + "、".join(result["remembered"]))
        
         if status == "success":
-            full_response = ""
-            for chunk in response.split():
-                full_response += chunk + " "
-                message_placeholder.markdown(full_response + "▌")
-                time.sleep(0.03)
-            message_placeholder.markdown(full_response)
-            
-            st.session_state.messages.append({"role": "assistant", "content": full_response})
+            with timer.span("render"):
+                message_placeholder.markdown(response)
+            st.session_state.messages.append({"role": "assistant", "content": response})
         else:
             st.error(response)
+        st.session_state.last_timings = timer.finish()
+        chat_service.record_turn(st.session_state.last_timings, status=status,
+                                 stream=stream_output, retrieval="semantic" if semantic_retrieval else "keyword")
 
 # 底部控制按钮
 col1, col2 = st.columns(2)
 with col1:
     if st.button("🗑️ 清空当前对话", use_container_width=True):
         st.session_state.messages = []
+        chat_service.reset_session(st.session_state.chat_session)
         st.rerun()
 
 with col2:
     if st.button("🔄 重新加载记忆", use_container_width=True):
-        memory_system.memories = memory_system.load_memories()
+        chat_service.reload(namespace)
         st.success("记忆已重新加载")
         st.rerun()
 
 # 调试信息（仅在开发时显示）
 with st.expander("🔧 调试信息"):
+    stats = chat_service.stats(namespace, st.session_state.chat_session, api_key)
     st.write("API密钥状态:", "已设置" if api_key else "未设置")
     st.write("密钥来源:", "Secrets" if 'ZHIPU_API_KEY' in st.secrets else "手动输入")
-    st.write("记忆文件格式:", "JSON, CSV, TXT")
-    st.write("当前记忆数量:", len(memory_system.memories))
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    st.write("对话核心:", f"对话服务 {st.secrets['CHAT_SERVICE_URL']}" if st.secrets.get("CHAT_SERVICE_URL") else "本进程")
+    st.write("记忆存储后端:", stats["backend"])
+    st.write("记忆命名空间:", namespace,
+             f"（已加载 {stats['loaded_namespaces']} 个，累计卸载 {stats['namespace_unloads']} 次）")
+    write_stats = stats["write_stats"]
+    if write_stats:
+        st.write("延迟写入:", f"改动 {write_stats['mutations']} 次 / 落盘 {write_stats['flushes']} 次"
+                 f"（合并 {write_stats['coalesced_writes']} 次），上次落盘 {write_stats['last_flush_ms']:.1f} ms，"
+                 f"最长 {write_stats['max_flush_ms']:.1f} ms")
+    eviction_stats = stats["eviction"]
+    if eviction_stats:
+        limits = " / ".join(part for part in (
+            f"{eviction_stats['max_entries']} 条" if eviction_stats['max_entries'] is not None else "",
+            f"{eviction_stats['max_bytes']} 字节" if eviction_stats['max_bytes'] is not None else "") if part)
+        st.write("记忆容量:", f"上限 {limits or '不限'}（{eviction_stats['policy'].upper()}），"
+                 f"LRU 淘汰 {eviction_stats['evicted_lru']} 条 / LFU 淘汰 {eviction_stats['evicted_lfu']} 条 / "
+                 f"过期删除 {eviction_stats['expired']} 条")
+    st.write("导入导出格式:", "JSON, CSV, TXT")
+    st.write("当前记忆数量:", stats["memory_count"])
+    cache_stats = stats["cache"]
+    st.write("回复缓存命中:", f"内存 {cache_stats['memory_hits']} / 磁盘 {cache_stats['disk_hits']} / "
+             f"未命中 {cache_stats['misses']}（命中率 {cache_stats['hit_rate']:.0%}）")
+    scheduler_stats = stats["scheduler"]
+    if scheduler_stats:
+        st.write("API调度:", f"已发出 {scheduler_stats['dispatched']} 次 / 合并相同请求 {scheduler_stats['coalesced']} 次 / "
+                 f"排队中 {scheduler_stats['queued']}（峰值 {scheduler_stats['max_queued']}）/ "
+                 f"排队超时 {scheduler_stats['timeouts']} 次")
+    st.write("已折叠进摘要的消息数:", stats["summarized_count"])
+    if "last_timings" in st.session_state:
+        # 上一轮对话各阶段耗时；总耗时减去各阶段之和是 Streamlit 自身的开销
+        st.write("上次回复耗时分解:")
+        st.dataframe([{"阶段": STAGE_LABELS.get(stage, stage), "耗时 (ms)": round(seconds * 1000, 1)}
+                      for stage, seconds in st.session_state.last_timings.items()],
+                     hide_index=True, use_container_width=True)
+        st.caption("指标文件: " + "、".join(stats["metrics_files"]))
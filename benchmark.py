@@ -0,0 +1,277 @@
+"""记忆系统与对话流程的离线基准测试
+
+生成含中英文混合关键词的合成记忆库，统计各操作的 p50/p99 延迟、吞吐量和峰值内存，
+结果以 JSON 输出，便于不同版本之间对比。
+
+用法：
+    python benchmark.py                                  # 默认 1k / 100k / 1M 条
+    python benchmark.py --sizes 1000 100000 --backend sqlite --output result.json
+    python benchmark.py --sizes 1000 --compare result.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+from chat_context import ConversationContext
+from chat_prompts import build_chat_messages
+from memory import MultiFormatMemory
+from memory_backends import SQLiteMemoryBackend, write_memory_file
+from memory_index import np
+from memory_store import CompactMemoryStore
+from memory_triggers import extract_memory_facts
+
+CJK_CHARS = ("我你他的是生日名字喜欢学习计划考试数学英语语文物理化学老师同学朋友家"
+             "北京上海电影音乐运动篮球游戏早餐晚饭周末作业复习")
+ASCII_CHARS = string.ascii_lowercase + string.digits
+MESSAGE_TEMPLATES = [
+    "我的名字是{}。很高兴认识你",
+    "我住在{}。附近有什么好玩的",
+    "我的生日是{}。记得提醒我",
+    "我喜欢{}。你呢",
+    "记住{}是重要的事情",
+    "帮我制定一个{}的学习计划",
+]
+
+
+def random_text(rng, min_len, max_len):
+    """生成中英文混合的随机文本（约七成汉字）"""
+    return "".join(
+        rng.choice(CJK_CHARS) if rng.random() < 0.7 else rng.choice(ASCII_CHARS)
+        for _ in range(rng.randint(min_len, max_len))
+    )
+
+
+def make_store(rng, size):
+    """生成 size 条合成记忆"""
+    now = datetime.now().isoformat()
+    store = {}
+    while len(store) < size:
+        store[random_text(rng, 2, 10)] = {"value": random_text(rng, 5, 30), "timestamp": now}
+    return store
+
+
+def make_messages(rng, keys, count):
+    """生成聊天消息，部分消息里嵌入已有关键词以产生命中"""
+    messages = []
+    for _ in range(count):
+        parts = [random_text(rng, 10, 30)]
+        for _ in range(rng.randint(0, 2)):
+            parts.append(rng.choice(keys))
+            parts.append(random_text(rng, 5, 15))
+        messages.append("".join(parts))
+    return messages
+
+
+def percentile(sorted_samples, q):
+    """最近秩法求分位数"""
+    index = max(0, min(len(sorted_samples) - 1, int(round(q / 100 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples, items_per_op=1):
+    """把耗时样本（秒）汇总成延迟分位数和吞吐量"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "mean_ms": total / len(ordered) * 1000,
+        "throughput_per_s": len(ordered) * items_per_op / total if total else None,
+    }
+
+
+def time_calls(fn, args_list):
+    """依次调用 fn(*args)，返回每次耗时"""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def store_bytes_per_entry(store, compact):
+    """用 tracemalloc 测量把 store 装进一种内存布局后每条记忆占用的字节数
+
+    关键词、值和时间戳字符串都重新创建，和从文件加载时一样不与 store 共享对象。
+    """
+    records = [(key.encode(), data["value"].encode(), data["timestamp"].encode()) for key, data in store.items()]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    if compact:
+        layout = CompactMemoryStore()
+        for key, value, timestamp in records:
+            layout.put(key.decode(), value.decode(), timestamp.decode())
+    else:
+        layout = {}
+        for key, value, timestamp in records:
+            layout[key.decode()] = {"value": value.decode(), "timestamp": timestamp.decode()}
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del layout
+    return used / len(records)
+
+
+def run_size(size, backend="file", seed=0, op_count=1000, compact_store=False):
+    """对一个规模跑完整套基准，返回结果字典"""
+    rng = random.Random(seed)
+    ops = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, "ai_memory")
+        store = make_store(rng, size)
+        keys = list(store)
+        # 两种内存布局的每条记忆字节数（最多取 10 万条测量）
+        sample = dict(zip(keys[:100000], (store[k] for k in keys[:100000])))
+        bytes_per_entry = {"dict": store_bytes_per_entry(sample, False),
+                           "compact": store_bytes_per_entry(sample, True)}
+        del sample
+
+        if backend == "sqlite":
+            memory = MultiFormatMemory(memory_file=base, backend=SQLiteMemoryBackend(base + ".db"))
+            memory.backend.put_many((k, d["value"], d["timestamp"]) for k, d in store.items())
+        else:
+            write_memory_file(base + ".json", "json", store.items())
+            memory = MultiFormatMemory(memory_file=base, compact_store=compact_store)
+        del store
+
+        load_reps = 3 if size >= 100000 else 10
+        ops["load_memories"] = summarize(time_calls(memory.load_memories, [()] * load_reps))
+
+        new_items = [(random_text(rng, 2, 10), random_text(rng, 5, 30)) for _ in range(op_count)]
+        ops["remember"] = summarize(time_calls(memory.remember, new_items))
+
+        queries = make_messages(rng, keys, op_count)
+        ops["get_relevant_memories"] = summarize(
+            time_calls(memory.get_relevant_memories, [(q,) for q in queries]))
+
+        texts = [rng.choice(MESSAGE_TEMPLATES).format(random_text(rng, 2, 8)) for _ in range(op_count * 10)]
+        ops["extract_memory_facts"] = summarize(time_calls(extract_memory_facts, [(t,) for t in texts]))
+
+        # 完整的提示词构建：相关记忆 + 历史摘要 + 系统提示词
+        context = ConversationContext()
+        history = []
+        for _ in range(10):
+            history.append({"role": "user", "content": random_text(rng, 20, 80)})
+            history.append({"role": "assistant", "content": random_text(rng, 50, 200)})
+        ops["build_prompt"] = summarize(time_calls(
+            build_chat_messages, [(memory, context, q, history) for q in queries]))
+
+        import_rows = max(1000, size // 10)
+        import_path = base + "_import.csv"
+        write_memory_file(import_path, "csv", (
+            (rng.choice(keys) if rng.random() < 0.5 else random_text(rng, 2, 10),
+             {"value": random_text(rng, 5, 30), "timestamp": ""})
+            for _ in range(import_rows)
+        ))
+        ops["import_memories"] = summarize(
+            time_calls(memory.import_memories, [(import_path,)] * 3), items_per_op=import_rows)
+
+        if np is not None:
+            # 语义检索放在最后：索引建好后 remember/导入 都要同步更新向量，会影响前面的计时
+            ops["build_semantic_index"] = summarize(time_calls(memory.get_semantic_index, [()]))
+            ops["get_relevant_memories_semantic"] = summarize(time_calls(
+                memory.get_relevant_memories, [(q, None, "semantic") for q in queries]))
+            batches = [(queries[i:i + 32], None, "semantic") for i in range(0, len(queries), 32)]
+            ops["get_relevant_memories_semantic_batch32"] = summarize(
+                time_calls(memory.get_relevant_memories_batch, batches), items_per_op=32)
+
+        memory.backend.close()
+
+    return {"size": size, "backend": backend, "compact_store": compact_store,
+            "peak_rss_mb": peak_rss_mb(), "bytes_per_entry": bytes_per_entry, "ops": ops}
+
+
+def compare(old, new, threshold):
+    """打印与旧结果的对比，返回退化项数量"""
+    run_key = lambda r: (r["size"], r["backend"], r.get("compact_store", False))
+    old_runs = {run_key(r): r for r in old["results"]}
+    regressions = 0
+    for run in new["results"]:
+        previous = old_runs.get(run_key(run))
+        if previous is None:
+            continue
+        for op, stats in run["ops"].items():
+            before = previous["ops"].get(op)
+            if not before:
+                continue
+            for metric in ("p50_ms", "p99_ms"):
+                change = (stats[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+                flag = ""
+                if change > threshold:
+                    flag = "  <-- 退化"
+                    regressions += 1
+                print(f"{run['backend']:>6} {run['size']:>8} {op:<22} {metric}: "
+                      f"{before[metric]:.3f} -> {stats[metric]:.3f} ms ({change:+.1%}){flag}",
+                      file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="记忆系统与对话流程的离线基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help="记忆库规模（条）")
+    parser.add_argument("--backend", choices=["file", "sqlite"], default="file")
+    parser.add_argument("--compact-store", action="store_true", help="文件后端使用紧凑内存存储")
+    parser.add_argument("--ops", type=int, default=1000, help="每项操作的调用次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定为退化的相对变化（默认 10%%）")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        print(f"正在测试 {size} 条记忆（{args.backend}）...", file=sys.stderr)
+        # 每个规模在独立子进程中运行，峰值内存互不影响
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(run_size, size, args.backend, args.seed, args.ops,
+                                           args.compact_store).result())
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
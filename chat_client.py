@@ -0,0 +1,142 @@
+import json
+
+import requests
+
+
+# === 对话服务的 HTTP 客户端（Streamlit 页面的服务模式） ===
+class ChatServiceClient:
+    """通过 HTTP 调用 chat_server.py，方法和返回值与 ChatCore 中页面用到的部分一致
+
+    页面只负责渲染：对话历史、记忆和统计都在服务端，多个页面进程可以共用一个服务。
+    """
+
+    def __init__(self, base_url, token=None, timeout=(5, 120)):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.info = None
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, self.base_url + path, **kwargs)
+        if response.status_code == 400:
+            raise ValueError(self.error_message(response))
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    def error_message(response):
+        try:
+            return response.json().get("error", response.text)
+        except ValueError:
+            return response.text
+
+    @property
+    def semantic_available(self):
+        if self.info is None:
+            self.info = self.request("GET", "/healthz").json()
+        return self.info.get("semantic", False)
+
+    # --- 对话 ---
+    def chat(self, namespace, session_id, prompt, on_delta=None, api_key=None, use_cache=False,
+             retrieval=None, auto_remember=False, timer=None):
+        """一轮对话，返回 {"response", "status", "remembered", "timings"}
+
+        传入 on_delta 时请求流式输出（NDJSON）；传入 timer 时把服务端的各阶段耗时并入它
+        （总耗时、首字延迟和渲染以页面这边的为准）。
+        """
+        payload = {"namespace": namespace, "session_id": session_id, "message": prompt,
+                   "stream": on_delta is not None, "use_cache": use_cache, "retrieval": retrieval,
+                   "auto_remember": auto_remember, "api_key": api_key}
+        try:
+            with self.request("POST", "/api/chat", json=payload, stream=on_delta is not None) as response:
+                if on_delta is None:
+                    result = response.json()
+                else:
+                    result = None
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        message = json.loads(line)
+                        if "delta" in message:
+                            on_delta(message["delta"])
+                        elif message.get("done"):
+                            result = message
+                    if result is None:
+                        return {"response": "对话服务连接中断", "status": "error", "remembered": [], "timings": {}}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return {"response": f"对话服务请求失败: {e}", "status": "error", "remembered": [], "timings": {}}
+        if timer is not None:
+            for stage, seconds in result.get("timings", {}).items():
+                if stage not in ("total", "ttft", "render"):
+                    timer.add(stage, seconds)
+        return result
+
+    def reset_session(self, session_id):
+        self.request("DELETE", f"/api/sessions/{requests.utils.quote(session_id, safe='')}")
+
+    def record_turn(self, timings, **fields):
+        """服务端已记录本轮耗时，页面这边不再重复记录"""
+
+    # --- 记忆操作 ---
+    def memory_count(self, namespace):
+        return self.list_memories(namespace, page_size=0)[0]
+
+    def list_memories(self, namespace, text="", page=1, page_size=20):
+        data = self.request("GET", "/api/memories", params={
+            "namespace": namespace, "filter": text, "page": page, "page_size": page_size}).json()
+        return data["total"], data["page"], [tuple(item) for item in data["items"]]
+
+    def remember(self, namespace, key, value):
+        return self.remember_many(namespace, [(key, value)])
+
+    def remember_many(self, namespace, items):
+        return self.request("POST", "/api/memories", json={
+            "namespace": namespace, "items": [list(item) for item in items]}).json()["success"]
+
+    def delete_many(self, namespace, keys):
+        return self.request("POST", "/api/memories/delete", json={
+            "namespace": namespace, "keys": list(keys)}).json()["success"]
+
+    def export_memories(self, namespace, file_format):
+        try:
+            response = self.request("GET", "/api/memories/export",
+                                    params={"namespace": namespace, "format": file_format})
+        except ValueError:
+            return None
+        response.encoding = "utf-8"
+        return response.text
+
+    def import_memories(self, namespace, stream, file_format, progress=None):
+        """上传整个文件由服务端流式解析；进度只在完成时回调一次"""
+        data = self.request("POST", "/api/memories/import", data=stream,
+                            params={"namespace": namespace, "format": file_format}).json()
+        if progress and data["success"]:
+            progress(data["count"], 0.0)
+        return data["success"], data["count"]
+
+    def export_delta(self, namespace, since=None):
+        response = self.request("GET", "/api/memories/delta", params={"namespace": namespace, "since": since or ""})
+        return response.content, response.headers["X-Delta-Until"]
+
+    def import_delta(self, namespace, stream):
+        try:
+            data = self.request("POST", "/api/memories/delta", data=stream, params={"namespace": namespace}).json()
+        except ValueError as e:
+            # 与本进程内的核心一致：文件格式不对时返回失败，不抛出
+            print(f"读取增量同步文件失败: {e}")
+            return False, 0, 0
+        return data["success"], data["updated"], data["deleted"]
+
+    def reload(self, namespace):
+        self.request("POST", "/api/memories/reload", params={"namespace": namespace})
+
+    def stats(self, namespace, session_id=None, api_key=None):
+        headers = {"X-Zhipu-Api-Key": api_key} if api_key else {}
+        return self.request("GET", "/api/stats", params={"namespace": namespace, "session_id": session_id or ""},
+                            headers=headers).json()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,71 @@
+# === 对话上下文管理（token 预算 + 滚动摘要） ===
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def extractive_summary(summary, messages, max_tokens=400):
+    """本地摘要：每条消息截取开头并入摘要，超出预算时丢弃最早的内容"""
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        speaker = "用户" if message["role"] == "user" else "助手"
+        lines.append(f"{speaker}：{message['content'][:80]}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationContext:
+    def __init__(self, token_budget=2000, min_recent=4, summarizer=None):
+        # 历史消息（含摘要）允许占用的 token 数
+        self.token_budget = token_budget
+        # 至少原样保留的最近消息条数
+        self.min_recent = min_recent
+        # summarizer(旧摘要, 新折叠的消息) -> 新摘要
+        self.summarizer = summarizer or extractive_summary
+        self.reset()
+
+    def reset(self):
+        """清空摘要（对话被清空时调用）"""
+        self.summary = ""
+        # history 中前 summarized_count 条已并入摘要，之后不再发送原文
+        self.summarized_count = 0
+        self.token_cache = {}
+
+    def message_tokens(self, index, message):
+        """单条消息的 token 数（按位置缓存，历史消息不会变）"""
+        tokens = self.token_cache.get(index)
+        if tokens is None:
+            tokens = estimate_tokens(message["content"]) + 4
+            self.token_cache[index] = tokens
+        return tokens
+
+    def build(self, history):
+        """返回 (摘要, 需要原样发送的最近消息)
+
+        最近消息超出预算时，把最早的一批折叠进摘要，折叠到只占一半预算为止，
+        这样摘要不会每轮都更新。
+        """
+        if len(history) < self.summarized_count:
+            self.reset()
+
+        start = self.summarized_count
+        budget = self.token_budget - (estimate_tokens(self.summary) if self.summary else 0)
+        used = sum(self.message_tokens(i, history[i]) for i in range(start, len(history)))
+
+        if used > budget:
+            target = budget // 2
+            stop = max(start, len(history) - self.min_recent)
+            fold_end = start
+            while fold_end < stop and used > target:
+                used -= self.message_tokens(fold_end, history[fold_end])
+                fold_end += 1
+            if fold_end > start:
+                self.summary = self.summarizer(self.summary, history[start:fold_end])
+                self.summarized_count = fold_end
+                for i in range(start, fold_end):
+                    self.token_cache.pop(i, None)
+
+        return self.summary, history[self.summarized_count:]
@@ -0,0 +1,342 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from api_scheduler import ApiScheduler
+from chat_context import ConversationContext, extractive_summary
+from chat_prompts import build_chat_messages
+from memory_backends import SQLiteMemoryBackend
+from memory_index import np
+from memory_namespaces import MemoryNamespaces
+from memory_triggers import extract_memory_facts
+from response_cache import ResponseCache
+from turn_metrics import MetricsRecorder, TurnTimer
+from zhipu_client import ZhipuClient
+
+# 配置项：Streamlit 中来自 st.secrets，服务模式下来自同名环境变量
+SETTING_NAMES = [
+    "ZHIPU_API_KEY", "ZHIPU_RPM", "ZHIPU_TPM", "ZHIPU_MAX_CONCURRENCY",
+    "MEMORY_BACKEND", "MEMORY_MAX_ACTIVE", "MEMORY_WRITE_BEHIND", "MEMORY_COMPACT_STORE",
+    "MEMORY_MAX_ENTRIES", "MEMORY_MAX_BYTES", "MEMORY_EVICTION", "MEMORY_TTL",
+    "METRICS_DIR", "HISTORY_TOKEN_BUDGET", "CHAT_MAX_SESSIONS",
+    "CHAT_SERVICE_TOKEN", "CHAT_SERVICE_MAX_BODY",
+]
+
+
+def optional_int(value):
+    return None if value in (None, "") else int(value)
+
+
+def setting_bool(value, default=False):
+    """Secrets 里是布尔值，环境变量里是字符串（"false"/"0" 为假）"""
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "off")
+    return bool(value)
+
+
+def settings_from_env(environ=None):
+    """从环境变量读取配置，MEMORY_TTL 是 JSON 对象，例如 {"临时*": 86400}"""
+    environ = os.environ if environ is None else environ
+    settings = {name: environ[name] for name in SETTING_NAMES if environ.get(name)}
+    if "MEMORY_TTL" in settings:
+        settings["MEMORY_TTL"] = json.loads(settings["MEMORY_TTL"])
+    return settings
+
+
+def create_namespaces(settings):
+    """按配置创建记忆命名空间"""
+    backend_factory = None
+    # MEMORY_BACKEND = "sqlite" 时每个命名空间一个 SQLite 库
+    if settings.get("MEMORY_BACKEND") == "sqlite":
+        backend_factory = lambda path: SQLiteMemoryBackend(path + ".db")
+    # 写后模式：记忆改动由后台线程合并落盘，不阻塞请求；MEMORY_WRITE_BEHIND = false 可关闭
+    return MemoryNamespaces(max_active=int(settings.get("MEMORY_MAX_ACTIVE", 64)),
+                            backend_factory=backend_factory,
+                            write_behind=setting_bool(settings.get("MEMORY_WRITE_BEHIND"), True),
+                            # 记忆很多时可开启紧凑存储（每条约省 35% 内存，加载稍慢）
+                            compact_store=setting_bool(settings.get("MEMORY_COMPACT_STORE")),
+                            # 每个命名空间的容量上限（条数 / 字节数），超出时按 MEMORY_EVICTION（lru/lfu）淘汰；
+                            # MEMORY_TTL 是 {关键词通配模式: 存活秒数}，例如 "临时*" = 86400
+                            max_entries=optional_int(settings.get("MEMORY_MAX_ENTRIES")),
+                            max_bytes=optional_int(settings.get("MEMORY_MAX_BYTES")),
+                            eviction=settings.get("MEMORY_EVICTION", "lru"),
+                            ttl_rules=dict(settings.get("MEMORY_TTL") or {}))
+
+
+class ChatSession:
+    """一个对话会话：完整历史和折叠摘要；同一会话的多轮对话串行执行"""
+
+    def __init__(self, session_id, context):
+        # 会话 ID 同时是调度器里的公平排队键：每个会话一条队列，不同会话轮流放行
+        self.session_id = session_id
+        self.messages = []
+        self.context = context
+        self.lock = threading.Lock()
+        # HTTP 服务模式下串行化多轮对话用的 asyncio.Lock，由 ChatService 在事件循环里创建
+        self.turn_lock = None
+        # 折叠摘要时调用模型所用的密钥（最近一轮的）
+        self.api_key = None
+
+
+class ChatTurn:
+    """prepare_turn 的结果：发给模型的消息，以及缓存和自动记忆的信息"""
+
+    def __init__(self, namespace, session, prompt, timer):
+        self.namespace = namespace
+        self.session = session
+        self.prompt = prompt
+        self.timer = timer
+        self.messages = None
+        self.cache_key = None
+        self.cached = None
+        self.remembered = []
+
+
+# === 对话核心（不依赖 Streamlit，页面和 HTTP 服务共用） ===
+class ChatCore:
+    """记忆命名空间、对话会话、回复缓存、耗时指标和模型调用的组合
+
+    一轮对话分三步：prepare_turn（自动记忆、检索记忆、构建提示词、查缓存）、
+    调用模型、finish_turn（写缓存、追加历史）。chat() 用线程版调度器同步完成这三步；
+    HTTP 服务在线程池里执行前后两步，中间用异步客户端调用模型。
+    summary_chat(密钥, messages, 会话 ID) 用于折叠早期对话时生成摘要，默认走同步调度器。
+    """
+
+    def __init__(self, settings=None, summary_chat=None):
+        self.settings = settings if settings is not None else {}
+        self.namespaces = create_namespaces(self.settings)
+        self.metrics = MetricsRecorder(self.settings.get("METRICS_DIR", "metrics"))
+        self.response_cache = ResponseCache()
+        self.default_api_key = self.settings.get("ZHIPU_API_KEY")
+        self.token_budget = int(self.settings.get("HISTORY_TOKEN_BUDGET", 2000))
+        self.summary_chat = summary_chat or self.scheduled_chat
+        # 会话 ID -> ChatSession，只保留最近活跃的 max_sessions 个
+        self.max_sessions = int(self.settings.get("CHAT_MAX_SESSIONS", 1000))
+        self.sessions = OrderedDict()
+        self.schedulers = {}
+        self.lock = threading.Lock()
+
+    @property
+    def semantic_available(self):
+        # 语义检索依赖 numpy，缺失时只提供关键词检索
+        return np is not None
+
+    # --- 模型调用 ---
+    def scheduler_options(self):
+        return {
+            "requests_per_minute": int(self.settings.get("ZHIPU_RPM", 60)),
+            "tokens_per_minute": int(self.settings.get("ZHIPU_TPM", 200000)),
+            "max_concurrency": int(self.settings.get("ZHIPU_MAX_CONCURRENCY", 5)),
+        }
+
+    def get_scheduler(self, api_key):
+        """同一个密钥的所有调用都经过同一个调度器：令牌桶限流、按会话轮转排队、相同请求合并"""
+        with self.lock:
+            scheduler = self.schedulers.get(api_key)
+            if scheduler is None:
+                scheduler = self.schedulers[api_key] = ApiScheduler(ZhipuClient(api_key), **self.scheduler_options())
+            return scheduler
+
+    def scheduled_chat(self, api_key, messages, session_id, on_delta=None):
+        return self.get_scheduler(api_key).chat(messages, on_delta=on_delta, session_id=session_id)
+
+    def summarize(self, session, summary, messages):
+        """用模型把新折叠的对话并入已有摘要，失败时退回本地摘要"""
+        if not session.api_key:
+            return extractive_summary(summary, messages)
+        transcript = "\n".join(
+            f"{'用户' if m['role'] == 'user' else '助手'}：{m['content']}" for m in messages
+        )
+        summary_messages = [
+            {"role": "system", "content": "你负责压缩对话记录。请把新的对话内容合并进已有摘要，"
+                                          "保留用户的个人信息、偏好和尚未解决的问题，控制在200字以内。"},
+            {"role": "user", "content": f"已有摘要：\n{summary or '无'}\n\n新的对话：\n{transcript}"}
+        ]
+        text, status = self.summary_chat(session.api_key, summary_messages, session.session_id)
+        if status != "success":
+            return extractive_summary(summary, messages)
+        return text.strip()
+
+    # --- 会话 ---
+    def get_session(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id, None)
+                session.context = ConversationContext(
+                    token_budget=self.token_budget,
+                    summarizer=lambda summary, messages: self.summarize(session, summary, messages)
+                )
+                self.sessions[session_id] = session
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            else:
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def reset_session(self, session_id):
+        """清空会话的历史和摘要"""
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    # --- 一轮对话 ---
+    def get_memory(self, namespace):
+        """返回命名空间的记忆系统；记忆文件被其他进程改动过（mtime/大小变化）时重新加载"""
+        memory = self.namespaces.get(namespace)
+        if memory.is_stale():
+            with self.metrics.timed("memory_load"):
+                memory.load_memories()
+        return memory
+
+    def prepare_turn(self, namespace, session_id, prompt, api_key=None, use_cache=False,
+                     retrieval=None, auto_remember=False, timer=None):
+        """对话前半段：自动记忆、检索相关记忆、构建消息、查回复缓存，返回 ChatTurn
+
+        调用方持有会话锁直到 finish_turn（ChatCore.chat 用 session.lock，HTTP 服务用 session.turn_lock），
+        同一会话的两轮不会交错。
+        """
+        memory = self.get_memory(namespace)
+        session = self.get_session(session_id)
+        session.api_key = api_key or self.default_api_key
+        turn = ChatTurn(namespace, session, prompt, timer or TurnTimer())
+        # 一次扫描提取消息里的全部事实，批量写入
+        if auto_remember:
+            facts = extract_memory_facts(prompt)
+            with turn.timer.span("memory_save"):
+                if facts and memory.remember_many(facts):
+                    turn.remembered = [key for key, _ in facts]
+
+        # 本轮之前的历史超出 token 预算的部分由 context 折叠成摘要
+        turn.messages, relevant_memories, system_prompt = build_chat_messages(
+            memory, session.context, prompt, session.messages, retrieval=retrieval, timer=turn.timer
+        )
+        session.messages.append({"role": "user", "content": prompt})
+        if use_cache:
+            # messages 是 [系统提示词, 最近几轮..., 本轮问题]
+            turn.cache_key = self.response_cache.make_key(prompt, relevant_memories, system_prompt,
+                                                          turn.messages[1:-1])
+            turn.cached = self.response_cache.get(turn.cache_key)
+        return turn
+
+    def finish_turn(self, turn, response, status):
+        """对话后半段：写回复缓存、追加历史，返回结果字典"""
+        if status == "success":
+            if turn.cache_key is not None and turn.cached is None:
+                self.response_cache.put(turn.cache_key, response)
+            turn.session.messages.append({"role": "assistant", "content": response})
+        return {"response": response, "status": status, "remembered": turn.remembered,
+                "timings": dict(turn.timer.spans)}
+
+    def chat(self, namespace, session_id, prompt, on_delta=None, api_key=None, use_cache=False,
+             retrieval=None, auto_remember=False, timer=None):
+        """同步完成一轮对话，返回 {"response", "status", "remembered", "timings"}
+
+        传入 on_delta 时流式回调增量文本；传入 timer（TurnTimer）时各阶段耗时记在它上面，
+        流式输出期间 timer 上 "render" 阶段的耗时从 API 耗时中扣除。
+        """
+        session = self.get_session(session_id)
+        with session.lock:
+            turn = self.prepare_turn(namespace, session_id, prompt, api_key, use_cache,
+                                     retrieval, auto_remember, timer)
+            if turn.cached is not None:
+                if on_delta is not None:
+                    on_delta(turn.cached)
+                return self.finish_turn(turn, turn.cached, "success")
+            if not turn.session.api_key:
+                return self.finish_turn(turn, "未设置API密钥", "error")
+            timer = turn.timer
+            render_before = timer.spans.get("render", 0.0)
+            start = time.perf_counter()
+            response, status = self.scheduled_chat(turn.session.api_key, turn.messages, session_id, on_delta)
+            timer.add("api_call", time.perf_counter() - start - (timer.spans.get("render", 0.0) - render_before))
+            return self.finish_turn(turn, response, status)
+
+    def record_turn(self, timings, **fields):
+        """记录一轮对话的各阶段耗时（turns.jsonl 和 Prometheus 直方图）"""
+        self.metrics.record(timings, **fields)
+
+    # --- 记忆操作 ---
+    def memory_count(self, namespace):
+        return len(self.get_memory(namespace).memories)
+
+    def list_memories(self, namespace, text="", page=1, page_size=20):
+        """按子串筛选关键词并分页，返回 (总条数, 实际页码, [(key, value)])；页码越界时收回到最后一页"""
+        memory = self.get_memory(namespace)
+        keys = memory.filter_keys(text)
+        page_count = max((len(keys) - 1) // page_size + 1, 1) if page_size else 1
+        page = min(max(page, 1), page_count)
+        items = []
+        for key in keys[(page - 1) * page_size:page * page_size]:
+            value = memory.recall_value(key)
+            if value is not None:
+                items.append((key, value))
+        return len(keys), page, items
+
+    def remember(self, namespace, key, value):
+        return self.remember_many(namespace, [(key, value)])
+
+    def remember_many(self, namespace, items):
+        with self.metrics.timed("memory_save"):
+            return self.get_memory(namespace).remember_many(items)
+
+    def delete_many(self, namespace, keys):
+        with self.metrics.timed("memory_save"):
+            return self.get_memory(namespace).delete_many(keys)
+
+    def export_memories(self, namespace, file_format):
+        """导出为指定格式，返回文件内容；失败时返回 None"""
+        memory = self.get_memory(namespace)
+        if not memory.export_memories(file_format):
+            return None
+        try:
+            with open(memory.get_export_path(file_format), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def import_memories(self, namespace, stream, file_format, progress=None):
+        """从二进制流导入，返回 (是否成功, 条数)"""
+        with self.metrics.timed("memory_save"):
+            return self.get_memory(namespace).import_stream(stream, file_format, progress=progress)
+
+    def export_delta(self, namespace, since=None):
+        return self.get_memory(namespace).export_delta(since)
+
+    def import_delta(self, namespace, stream):
+        with self.metrics.timed("memory_save"):
+            return self.get_memory(namespace).import_delta(stream)
+
+    def reload(self, namespace):
+        with self.metrics.timed("memory_load"):
+            self.namespaces.get(namespace).load_memories()
+
+    def stats(self, namespace, session_id=None, api_key=None):
+        """调试面板用的运行状态"""
+        memory = self.get_memory(namespace)
+        backend = memory.backend
+        write_stats = getattr(backend, "write_stats", None)
+        api_key = api_key or self.default_api_key
+        with self.lock:
+            session = self.sessions.get(session_id)
+            scheduler = self.schedulers.get(api_key)
+        return {
+            "backend": backend.name,
+            "namespace": namespace,
+            "loaded_namespaces": len(self.namespaces),
+            "namespace_unloads": self.namespaces.stats["unloads"],
+            "write_stats": dict(write_stats) if write_stats and backend.write_behind else None,
+            "eviction": memory.eviction_stats(),
+            "memory_count": len(memory.memories),
+            "cache": {**self.response_cache.stats, "hit_rate": self.response_cache.hit_rate()},
+            "scheduler": dict(scheduler.stats) if scheduler is not None else None,
+            "summarized_count": session.context.summarized_count if session is not None else 0,
+            "metrics_files": [self.metrics.jsonl_path, self.metrics.prom_path],
+        }
+
+    def close(self):
+        """落盘全部延迟写入（进程退出前调用）"""
+        self.namespaces.close()
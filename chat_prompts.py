@@ -0,0 +1,43 @@
+from turn_metrics import TurnTimer
+
+# === 对话提示词构建（不依赖 Streamlit，可被基准测试等脚本直接导入） ===
+
+def build_chat_messages(memory_system, context, prompt, conversation_history, retrieval=None, timer=None):
+    """构建一次对话请求，返回 (messages, 相关记忆, 系统提示词)
+
+    conversation_history 是本轮之前的消息，超出 token 预算的早期部分由 context 折叠成摘要。
+    retrieval 指定相关记忆的检索方式（"keyword"/"semantic"），None 表示用记忆系统的默认方式。
+    传入 timer（TurnTimer）时记录 memory_lookup 和 prompt_build 两个阶段的耗时。
+    """
+    if timer is None:
+        timer = TurnTimer()
+    # 获取相关记忆
+    with timer.span("memory_lookup"):
+        relevant_memories = memory_system.get_relevant_memories(prompt, retrieval=retrieval)
+
+    with timer.span("prompt_build"):
+        messages, system_prompt = build_system_messages(relevant_memories, context, prompt, conversation_history)
+    return messages, relevant_memories, system_prompt
+
+
+def build_system_messages(relevant_memories, context, prompt, conversation_history):
+    """由相关记忆和对话历史构建 (messages, 系统提示词)"""
+    memory_context = ""
+    if relevant_memories:
+        memory_context = "以下是你之前记住的信息：\n" + "\n".join(relevant_memories) + "\n\n"
+
+    # 早期对话折叠成摘要，只原样发送最近几轮
+    summary, recent_history = context.build(conversation_history)
+    summary_context = f"此前对话摘要：\n{summary}\n\n" if summary else ""
+
+    # 构建系统提示词（包含记忆）
+    system_prompt = f"""
+    你是一个有记忆的AI助手。{memory_context}{summary_context}
+    请基于已有信息回答问题。如果用户提到新的重要信息，请主动询问是否需要记住这些信息。
+    你是一个说话风趣幽默的AI助手。
+    """
+
+    # 构建消息
+    messages = ([{"role": "system", "content": system_prompt}]
+                + recent_history + [{"role": "user", "content": prompt}])
+    return messages, system_prompt
@@ -0,0 +1,327 @@
+"""对话核心的 HTTP 服务模式（asyncio + tornado）
+
+一个进程承载大量并发会话：记忆读写和提示词构建在线程池里执行，
+模型调用用异步客户端和异步调度器，等待上游时不占线程。Streamlit 页面配置
+CHAT_SERVICE_URL 后作为它的客户端（见 chat_client.py）。
+
+用法：
+    ZHIPU_API_KEY=... python chat_server.py --port 8765
+
+配置项与 Streamlit Secrets 同名，从环境变量读取（见 chat_core.SETTING_NAMES）；
+设置 CHAT_SERVICE_TOKEN 后请求需带 "Authorization: Bearer <token>"。
+
+接口（请求和响应都是 JSON，另有说明的除外）：
+    POST /api/chat                 一轮对话（必须带 session_id）；stream 为真时返回 NDJSON 流：
+                                   {"delta": ...} 若干行，最后一行 {"done": true, "response", "status", ...}
+    DELETE /api/sessions/<id>      清空会话历史
+    GET  /api/memories             ?namespace&filter&page&page_size 分页列出记忆
+    POST /api/memories             {"namespace", "items": [[key, value], ...]} 写入记忆
+    POST /api/memories/delete      {"namespace", "keys": [...]} 删除记忆
+    GET  /api/memories/export      ?namespace&format 导出（响应体为文件内容）
+    POST /api/memories/import      ?namespace&format 导入（请求体为文件内容）
+    GET  /api/memories/delta       ?namespace&since 增量导出（gzip，X-Delta-Until 头为 until）
+    POST /api/memories/delta       ?namespace 合并增量文件（请求体为文件内容）
+    POST /api/memories/reload      ?namespace 重新加载记忆
+    GET  /api/stats                ?namespace&session_id 运行状态
+    GET  /healthz                  健康检查
+"""
+import argparse
+import asyncio
+import hmac
+import io
+import json
+import time
+
+import tornado.web
+from tornado.iostream import StreamClosedError
+
+from api_scheduler import AsyncApiScheduler
+from chat_core import ChatCore, setting_bool, settings_from_env
+from zhipu_client import AsyncZhipuClient
+
+
+# === 异步服务 ===
+class ChatService:
+    """ChatCore 加上异步模型调用：每个密钥一个 AsyncApiScheduler，同步部分放进线程池"""
+
+    def __init__(self, settings):
+        self.core = ChatCore(settings, summary_chat=self.blocking_chat)
+        self.schedulers = {}
+        self.loop = None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    def get_scheduler(self, api_key):
+        scheduler = self.schedulers.get(api_key)
+        if scheduler is None:
+            options = self.core.scheduler_options()
+            # 连接池和调度器的并发上限一致，放行的请求不会在客户端里再排队
+            scheduler = self.schedulers[api_key] = AsyncApiScheduler(
+                AsyncZhipuClient(api_key, pool_size=options["max_concurrency"]), **options)
+        return scheduler
+
+    def blocking_chat(self, api_key, messages, session_id):
+        """在线程池里（折叠摘要时）同步等待一次异步调用"""
+        async def call():
+            # 调度器和异步客户端要在事件循环线程里创建
+            return await self.get_scheduler(api_key).chat(messages, session_id=session_id)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result()
+
+    async def run_sync(self, func, *args):
+        return await self.loop.run_in_executor(None, func, *args)
+
+    async def chat(self, namespace, session_id, prompt, on_delta=None, api_key=None, use_cache=False,
+                   retrieval=None, auto_remember=False):
+        """与 ChatCore.chat 相同，返回结果字典"""
+        session = self.core.get_session(session_id)
+        # 同一会话的多轮串行执行：在事件循环上等 asyncio 锁，不占用线程池里的线程
+        if session.turn_lock is None:
+            session.turn_lock = asyncio.Lock()
+        async with session.turn_lock:
+            turn = await self.run_sync(self.core.prepare_turn, namespace, session_id, prompt, api_key,
+                                       use_cache, retrieval, auto_remember)
+            if on_delta is not None:
+                forward = on_delta
+
+                def on_delta(delta):
+                    turn.timer.mark("ttft")
+                    forward(delta)
+            if turn.cached is not None:
+                if on_delta is not None:
+                    on_delta(turn.cached)
+                response, status = turn.cached, "success"
+            elif not turn.session.api_key:
+                response, status = "未设置API密钥", "error"
+            else:
+                with turn.timer.span("api_call"):
+                    response, status = await self.get_scheduler(turn.session.api_key).chat(
+                        turn.messages, on_delta=on_delta, session_id=session_id)
+            # 写回复缓存和耗时指标都要写文件，放进线程池
+            return await self.run_sync(self.finish_turn, turn, response, status,
+                                       on_delta is not None, retrieval)
+
+    def finish_turn(self, turn, response, status, stream, retrieval):
+        result = self.core.finish_turn(turn, response, status)
+        result["timings"] = turn.timer.finish()
+        self.core.record_turn(result["timings"], status=status, stream=stream,
+                              retrieval=retrieval or "keyword", source="service")
+        return result
+
+    def stats(self, namespace, session_id=None, api_key=None):
+        stats = self.core.stats(namespace, session_id, api_key)
+        scheduler = self.schedulers.get(api_key or self.core.default_api_key)
+        stats["scheduler"] = dict(scheduler.stats) if scheduler is not None else None
+        return stats
+
+
+# === 请求处理 ===
+class ServiceHandler(tornado.web.RequestHandler):
+    def initialize(self, service, token=None):
+        self.service = service
+        self.token = token
+
+    def prepare(self):
+        if self.token:
+            expected = f"Bearer {self.token}"
+            if not hmac.compare_digest(self.request.headers.get("Authorization", ""), expected):
+                raise tornado.web.HTTPError(401)
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None, None))[1]
+        self.write_json({"error": getattr(error, "reason", None) or str(status_code)}, status_code)
+
+    def write_json(self, data, status_code=200):
+        self.set_status(status_code)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(data, ensure_ascii=False))
+
+    def json_body(self):
+        try:
+            return json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="请求体不是合法的 JSON")
+
+    @property
+    def namespace(self):
+        return self.get_argument("namespace", "default")
+
+
+class ChatHandler(ServiceHandler):
+    async def post(self):
+        body = self.json_body()
+        prompt = body.get("message")
+        if not prompt:
+            raise tornado.web.HTTPError(400, reason="缺少 message")
+        stream = setting_bool(body.get("stream"), True)
+        options = dict(api_key=body.get("api_key"), use_cache=setting_bool(body.get("use_cache")),
+                       retrieval=body.get("retrieval"), auto_remember=setting_bool(body.get("auto_remember")))
+        session_id = body.get("session_id")
+        if not session_id:
+            # 不给默认值：省略它的客户端会共用同一段对话历史
+            raise tornado.web.HTTPError(400, reason="缺少 session_id")
+        namespace = body.get("namespace", "default")
+        if not stream:
+            result = await self.service.chat(namespace, session_id, prompt, **options)
+            self.write_json(result)
+            return
+
+        self.set_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.closed = False
+
+        def on_delta(delta):
+            # 客户端断开后继续完成这一轮（历史和缓存照常更新），只是不再写出
+            if self.closed:
+                return
+            self.write(json.dumps({"delta": delta}, ensure_ascii=False) + "\n")
+            # 不等待写完；连接已断开时的异常由 on_connection_close 处理，这里只取走以免告警
+            self.flush().add_done_callback(lambda future: future.exception())
+
+        result = await self.service.chat(namespace, session_id, prompt, on_delta=on_delta, **options)
+        if not self.closed:
+            try:
+                self.finish(json.dumps({"done": True, **result}, ensure_ascii=False) + "\n")
+            except StreamClosedError:
+                pass
+
+    def on_connection_close(self):
+        self.closed = True
+
+
+class SessionHandler(ServiceHandler):
+    def delete(self, session_id):
+        self.service.core.reset_session(session_id)
+        self.write_json({"success": True})
+
+
+class MemoriesHandler(ServiceHandler):
+    async def get(self):
+        total, page, items = await self.service.run_sync(
+            self.service.core.list_memories, self.namespace, self.get_argument("filter", "").strip(),
+            int(self.get_argument("page", 1)), int(self.get_argument("page_size", 20)))
+        self.write_json({"total": total, "page": page, "items": items})
+
+    async def post(self):
+        body = self.json_body()
+        items = [(str(key), str(value)) for key, value in body.get("items", [])]
+        success = await self.service.run_sync(
+            self.service.core.remember_many, body.get("namespace", "default"), items)
+        self.write_json({"success": bool(success)})
+
+
+class MemoryDeleteHandler(ServiceHandler):
+    async def post(self):
+        body = self.json_body()
+        success = await self.service.run_sync(
+            self.service.core.delete_many, body.get("namespace", "default"), body.get("keys", []))
+        self.write_json({"success": bool(success)})
+
+
+class MemoryExportHandler(ServiceHandler):
+    async def get(self):
+        file_format = self.get_argument("format", "json")
+        content = await self.service.run_sync(self.service.core.export_memories, self.namespace, file_format)
+        if content is None:
+            raise tornado.web.HTTPError(400, reason="导出失败")
+        self.set_header("Content-Type", "text/plain; charset=utf-8")
+        self.finish(content)
+
+
+class MemoryImportHandler(ServiceHandler):
+    async def post(self):
+        success, count = await self.service.run_sync(
+            self.service.core.import_memories, self.namespace, io.BytesIO(self.request.body),
+            self.get_argument("format", "json"))
+        self.write_json({"success": success, "count": count})
+
+
+class MemoryDeltaHandler(ServiceHandler):
+    async def get(self):
+        try:
+            data, until = await self.service.run_sync(
+                self.service.core.export_delta, self.namespace, self.get_argument("since", "") or None)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="起始时间格式不正确")
+        self.set_header("Content-Type", "application/gzip")
+        self.set_header("X-Delta-Until", until)
+        self.finish(data)
+
+    async def post(self):
+        success, updated, deleted = await self.service.run_sync(
+            self.service.core.import_delta, self.namespace, io.BytesIO(self.request.body))
+        if not success and not updated and not deleted:
+            # 读取或校验增量文件失败（合并时写入失败的至少有一条写入或删除）
+            raise tornado.web.HTTPError(400, reason="增量同步文件格式不正确")
+        self.write_json({"success": success, "updated": updated, "deleted": deleted})
+
+
+class MemoryReloadHandler(ServiceHandler):
+    async def post(self):
+        await self.service.run_sync(self.service.core.reload, self.namespace)
+        self.write_json({"success": True})
+
+
+class StatsHandler(ServiceHandler):
+    async def get(self):
+        stats = await self.service.run_sync(
+            self.service.stats, self.namespace, self.get_argument("session_id", None),
+            self.request.headers.get("X-Zhipu-Api-Key"))
+        self.write_json(stats)
+
+
+class HealthHandler(ServiceHandler):
+    def prepare(self):
+        # 健康检查不需要令牌
+        pass
+
+    def get(self):
+        self.write_json({"status": "ok", "semantic": self.service.core.semantic_available,
+                         "time": time.time()})
+
+
+def make_app(service, token=None):
+    options = {"service": service, "token": token}
+    return tornado.web.Application([
+        (r"/api/chat", ChatHandler, options),
+        (r"/api/sessions/([^/]+)", SessionHandler, options),
+        (r"/api/memories", MemoriesHandler, options),
+        (r"/api/memories/delete", MemoryDeleteHandler, options),
+        (r"/api/memories/export", MemoryExportHandler, options),
+        (r"/api/memories/import", MemoryImportHandler, options),
+        (r"/api/memories/delta", MemoryDeltaHandler, options),
+        (r"/api/memories/reload", MemoryReloadHandler, options),
+        (r"/api/stats", StatsHandler, options),
+        (r"/healthz", HealthHandler, options),
+    ])
+
+
+async def serve(host, port, settings):
+    service = ChatService(settings)
+    service.start()
+    app = make_app(service, settings.get("CHAT_SERVICE_TOKEN"))
+    # 导入记忆的请求体可能较大，默认上限 100MB
+    server = app.listen(port, address=host,
+                        max_body_size=int(settings.get("CHAT_SERVICE_MAX_BODY", 100 * 1024 * 1024)))
+    print(f"对话服务已启动: http://{host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.stop()
+        # 落盘全部延迟写入
+        service.core.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话核心的 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, settings_from_env()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from memory_backends import FileMemoryBackend, MEMORY_FORMATS, write_memory_file
+from memory_eviction import EvictionPolicy
+from memory_import import iter_memory_records
+from memory_index import SemanticIndex
+from memory_sync import TombstoneLog, plan_merge, read_delta, write_delta
+
+
+# === 多格式记忆系统 ===
+class MultiFormatMemory:
+    def __init__(self, memory_file="ai_memory", default_format="json",
+                 journal=True, compact_threshold=1000, max_relevant=20, backend=None,
+                 retrieval="keyword", write_behind=False, flush_interval=0.5, flush_max_changes=100,
+                 compact_store=False, max_entries=None, max_bytes=None, eviction="lru", ttl_rules=None):
+        self.memory_file = memory_file
+        self.default_format = default_format
+        # 存储后端：默认是 json/csv/txt 文件（带追加日志），也可以传入 SQLiteMemoryBackend；
+        # json/csv/txt 始终可用作导入导出格式；write_behind 时文件后端由后台线程合并落盘，
+        # compact_store 时内存中按列存放记忆（CompactMemoryStore）
+        if backend is None:
+            backend = FileMemoryBackend(memory_file, default_format, journal, compact_threshold,
+                                        write_behind, flush_interval, flush_max_changes, compact_store)
+        self.backend = backend
+        # 每次注入系统提示词的相关记忆上限，None 表示不限
+        self.max_relevant = max_relevant
+        # 默认检索方式："keyword"（子串匹配）或 "semantic"（n-gram 向量余弦相似度）
+        self.retrieval = retrieval
+        # 语义索引在第一次语义检索时才构建，之后随 remember/delete 增量更新；
+        # 后端写入时因外部改动原地重新加载后（generation 变化）整体重建
+        self.semantic = None
+        self.backend_generation = None
+        # 容量上限（条数 max_entries 或字节数 max_bytes）和按关键词模式的过期时间（ttl_rules），
+        # 超出时按 eviction（"lru" 或 "lfu"）淘汰；都不设时不限容量，也不记录访问统计
+        self.eviction = None
+        if max_entries is not None or max_bytes is not None or ttl_rules:
+            self.eviction = EvictionPolicy(max_entries, max_bytes, eviction, ttl_rules)
+        # 删除记录，增量同步时把删除传播到其他设备
+        self.tombstones = TombstoneLog(f"{memory_file}.tombstones")
+        # 同一实例会被多个 Streamlit 会话共享，读写都要串行化
+        self.lock = threading.RLock()
+        self.memories = self.load_memories()
+
+    def get_file_path(self, file_format=None):
+        """获取文件路径"""
+        if file_format is None:
+            file_format = self.default_format
+        return f"{self.memory_file}.{file_format}"
+
+    def load_memories(self):
+        """加载记忆（由后端决定存储方式）"""
+        with self.lock:
+            self.memories = self.backend.load()
+            self.backend_generation = self.backend.generation
+            self.tombstones.load()
+            if self.semantic is not None:
+                self.semantic.build(self.memories)
+            if self.eviction is not None:
+                self.eviction.reset(self.memories)
+                # 上限调低或有记忆在停机期间过期时，加载后立即生效
+                self.enforce_limits(force_sweep=True)
+            return self.memories
+
+    def sync_reloaded(self):
+        """后端写入时读回了其他进程的改动：重建语义索引，重算容量统计"""
+        with self.lock:
+            if self.backend.generation == self.backend_generation:
+                return
+            self.backend_generation = self.backend.generation
+            if self.semantic is not None:
+                self.semantic.build(self.memories)
+            if self.eviction is not None:
+                self.eviction.reset(self.memories)
+
+    def is_stale(self):
+        """后端存储是否被其他进程改动过（需要重新加载）"""
+        return self.backend.is_stale()
+
+    def get_export_path(self, file_format=None):
+        """导出文件路径：和后端快照分开，导出不会覆盖其他进程只写进日志的改动"""
+        if file_format is None:
+            file_format = self.default_format
+        return f"{self.memory_file}.export.{file_format}"
+
+    def save_memories(self, file_format=None):
+        """保存记忆到导出文件 - 支持多种格式"""
+        if file_format is None:
+            file_format = self.default_format
+
+        try:
+            with self.lock, self.backend.shard_lock():
+                write_memory_file(self.get_export_path(file_format), file_format, self.memories.items())
+            return True
+        except Exception as e:
+            print(f"保存{file_format}格式记忆失败: {e}")
+            return False
+
+    def flush(self):
+        """立即落盘延迟写入的改动（写后模式下进程退出前调用）"""
+        return self.backend.flush()
+
+    def compact(self):
+        """压缩后端存储（文件后端生成快照并清空日志）"""
+        with self.lock:
+            self.tombstones.compact(self.memories)
+            return self.backend.compact()
+
+    def remember(self, key, value):
+        """记住一个事实"""
+        return self.remember_many([(key, value)])
+
+    def remember_many(self, items):
+        """一次记住多个 (key, value)，只落盘一次"""
+        timestamp = datetime.now().isoformat()
+        return self.put_records([(key, value, timestamp) for key, value in items])
+
+    def put_records(self, records):
+        """写入 (key, value, timestamp) 记录，保留给定的时间戳（增量同步用）"""
+        records = list(records)
+        with self.lock:
+            if self.semantic is not None:
+                self.semantic.add_many((key, value) for key, value, _ in records)
+            if self.eviction is not None:
+                for key, value, _ in records:
+                    self.eviction.on_put(key, value, self.recall_value(key))
+            success = self.backend.put_many(records)
+            self.sync_reloaded()
+            self.enforce_limits()
+            return success
+
+    def delete(self, key):
+        """删除一个事实"""
+        return self.delete_many([key])
+
+    def delete_many(self, keys, sync=True):
+        """批量删除，只落盘一次
+
+        sync 为 True 时记下删除时间，增量同步时传播到其他设备；
+        容量淘汰和过期删除只影响本机，不记录。
+        """
+        keys = list(dict.fromkeys(keys))
+        with self.lock:
+            if sync:
+                timestamp = datetime.now().isoformat()
+                self.tombstones.record((key, timestamp) for key in keys if key in self.memories)
+            if self.semantic is not None:
+                for key in keys:
+                    self.semantic.remove(key)
+            if self.eviction is not None:
+                for key in keys:
+                    self.eviction.on_delete(key, self.recall_value(key))
+            success = self.backend.delete_many(keys)
+            self.sync_reloaded()
+            return success
+
+    def enforce_limits(self, force_sweep=False):
+        """删除已过期的记忆，超出容量时按淘汰策略删除到上限以下；返回删除的条数"""
+        if self.eviction is None:
+            return 0
+        with self.lock:
+            removed = 0
+            expired = self.eviction.select_expired(self.memories, force_sweep)
+            if expired:
+                self.delete_many(expired, sync=False)
+                removed += len(expired)
+            victims = self.eviction.select_victims(self.memories)
+            if victims:
+                self.delete_many(victims, sync=False)
+                removed += len(victims)
+            return removed
+
+    def eviction_stats(self):
+        """淘汰计数和当前用量；未设置容量限制时返回 None"""
+        if self.eviction is None:
+            return None
+        return {**self.eviction.stats, "entries": len(self.memories), "bytes": self.eviction.total_bytes,
+                "max_entries": self.eviction.max_entries, "max_bytes": self.eviction.max_bytes,
+                "policy": self.eviction.policy}
+
+    def filter_keys(self, text=""):
+        """按子串筛选关键词（走后端索引），text 为空时返回全部"""
+        with self.lock:
+            return self.backend.filter_keys(text)
+
+    def recall(self, key):
+        """回忆一个事实（计入访问统计）；已过期的返回 None"""
+        value = self.recall_value(key)
+        if value is not None and self.is_expired(key):
+            return None
+        if value is not None and self.eviction is not None:
+            with self.lock:
+                self.eviction.touch([key])
+        return value
+
+    def is_expired(self, key):
+        """记忆是否已过期但还没被定期清理删除"""
+        if self.eviction is None or not self.eviction.ttl_rules:
+            return False
+        data = self.memories.get(key)
+        return data is not None and self.eviction.is_expired(key, data)
+
+    def recall_value(self, key):
+        """只读取值，不计入访问统计"""
+        return self.memories.get(key, {}).get("value")
+
+    def get_semantic_index(self):
+        """返回语义索引，第一次调用时用当前全部记忆构建（需要 numpy）"""
+        with self.lock:
+            self.sync_reloaded()
+            if self.semantic is None:
+                semantic = SemanticIndex()
+                semantic.build(self.memories)
+                self.semantic = semantic
+            return self.semantic
+
+    def format_relevant(self, keys):
+        relevant = []
+        for key in keys:
+            data = self.memories.get(key)
+            if data is not None:
+                relevant.append(f"{key}: {data['value']}")
+        return relevant
+
+    def get_relevant_memories(self, query, limit=None, retrieval=None):
+        """获取相关记忆（按相关度排序，最多返回 limit 条）
+
+        retrieval 为 None 时使用实例的默认检索方式。
+        """
+        return self.get_relevant_memories_batch([query], limit, retrieval)[0]
+
+    def get_relevant_memories_batch(self, queries, limit=None, retrieval=None):
+        """批量获取相关记忆，返回与 queries 一一对应的列表；语义检索只做一次矩阵乘法"""
+        if limit is None:
+            limit = self.max_relevant
+        if retrieval is None:
+            retrieval = self.retrieval
+        with self.lock:
+            # 按 sweep_interval 定期清理过期记忆；两次清理之间过期的从检索结果里滤掉
+            self.enforce_limits()
+            if retrieval == "semantic":
+                results = self.get_semantic_index().search_batch(list(queries), limit)
+            else:
+                results = [self.backend.search(query, limit) for query in queries]
+            if self.eviction is not None:
+                if self.eviction.ttl_rules:
+                    results = [[key for key in keys if not self.is_expired(key)] for keys in results]
+                for keys in results:
+                    self.eviction.touch(keys)
+            return [self.format_relevant(keys) for keys in results]
+
+    def export_memories(self, file_format):
+        """导出记忆到指定格式"""
+        return self.save_memories(file_format)
+
+    def import_stream(self, stream, file_format, batch_size=1000, progress=None):
+        """从二进制流导入记忆：边解析边按批合并，最后统一落盘一次
+
+        progress(已导入条数, 每秒条数) 在每批合并后调用；返回 (是否成功, 导入条数)。
+        """
+        if file_format not in MEMORY_FORMATS:
+            return False, 0
+        start = time.perf_counter()
+        count = 0
+        with self.lock:
+            self.backend.begin_import()
+            try:
+                batch = []
+                for record in iter_memory_records(stream, file_format):
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        self.import_batch(batch)
+                        count += len(batch)
+                        batch = []
+                        if progress:
+                            progress(count, count / max(time.perf_counter() - start, 1e-9))
+                if batch:
+                    self.import_batch(batch)
+                    count += len(batch)
+                success = self.backend.commit_import()
+                if self.eviction is not None:
+                    self.eviction.reset(self.memories)
+                    self.enforce_limits()
+            except Exception as e:
+                self.backend.abort_import()
+                # 丢弃已合并但未提交的部分
+                self.load_memories()
+                print(f"导入记忆失败: {e}")
+                return False, count
+        if progress:
+            progress(count, count / max(time.perf_counter() - start, 1e-9))
+        return success, count
+
+    def export_delta(self, since=None):
+        """导出 since（ISO 时间）之后改动和删除的记忆，返回 (gzip 字节, until)
+
+        since 为 None 时导出全部；until 留作下次导出的 since。
+        """
+        with self.lock:
+            return write_delta(self.memories, self.tombstones, since)
+
+    def import_delta(self, stream):
+        """导入增量文件：按时间戳后写者胜合并，删除记录同样按时间比较
+
+        返回 (是否成功, 写入条数, 删除条数)；对方的删除记录会转存到本机，继续传播给其他设备。
+        """
+        try:
+            delta = read_delta(stream)
+        except (OSError, EOFError, ValueError) as e:
+            # EOFError：gzip 文件被截断
+            print(f"读取增量同步文件失败: {e}")
+            return False, 0, 0
+        with self.lock:
+            updates, deletes = plan_merge(self.memories, self.tombstones, delta)
+            success = True
+            if updates:
+                success = self.put_records(updates)
+            # 删除记录带对方的删除时间，单独记下；本机删除不再另记当前时间
+            present = [key for key, _ in deletes if key in self.memories]
+            if present:
+                success = self.delete_many(present, sync=False) and success
+            self.tombstones.record(deletes)
+            return success, len(updates), len(present)
+
+    def import_batch(self, records):
+        """把一批导入记录合并进后端（和语义索引）"""
+        self.backend.import_batch(records)
+        if self.semantic is not None:
+            self.semantic.add_many((key, value) for key, value, _ in records)
+
+    def import_memories(self, file_path):
+        """从文件导入记忆"""
+        file_format = os.path.splitext(file_path)[1].lstrip('.')
+        if file_format not in MEMORY_FORMATS:
+            return False
+        try:
+            with open(file_path, 'rb') as f:
+                return self.import_stream(f, file_format)[0]
+        except OSError as e:
+            print(f"导入记忆失败: {e}")
+            return False
@@ -0,0 +1,909 @@
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只做进程内互斥
+    fcntl = None
+
+from memory_import import iter_memory_records
+from memory_index import KeywordIndex
+from memory_snapshot import iter_snapshot_records, load_snapshot, write_snapshot
+from memory_store import CompactMemoryStore
+
+MEMORY_FORMATS = ["json", "csv", "txt"]
+
+
+# === 分片文件锁 ===
+class ShardLock:
+    """一个存储分片的建议锁（fcntl.flock 排他锁），同一进程内可重入
+
+    多个进程（例如多个 Streamlit worker）写同一分片时，追加日志、重写快照和
+    加载都在锁内进行，不会读到另一个进程写了一半的文件。
+    分片目录和锁文件在第一次写入（writing()）时才创建；只读访问一个从未写过的
+    分片时锁文件不存在，也就没有需要保护的文件，不加锁。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.handle = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0 and fcntl is not None and os.path.exists(self.path):
+            try:
+                self.handle = open(self.path, 'a')
+                fcntl.flock(self.handle, fcntl.LOCK_EX)
+            except OSError as e:
+                # 拿不到文件锁时照常读写，只是失去跨进程保护
+                print(f"获取记忆文件锁失败: {e}")
+                if self.handle is not None:
+                    self.handle.close()
+                    self.handle = None
+        self.depth += 1
+        return self
+
+    def writing(self):
+        """写分片文件前调用：按需创建分片目录和锁文件，返回锁本身"""
+        directory = os.path.dirname(self.path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            open(self.path, 'a').close()
+        except OSError as e:
+            print(f"创建记忆分片失败: {e}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.depth -= 1
+        if self.depth == 0 and self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        self.thread_lock.release()
+        return False
+
+
+# === 记忆文件读写（json/csv/txt） ===
+def read_memory_file(file_path, file_format):
+    """读取一个记忆文件，返回 {key: {"value", "timestamp"}}"""
+    memories = {}
+    if file_format == "json":
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    elif file_format == "csv":
+        with open(file_path, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                memories[row['key']] = {
+                    "value": row['value'],
+                    "timestamp": row.get('timestamp') or datetime.now().isoformat()
+                }
+    elif file_format == "txt":
+        # txt 格式不含时间，统一记为读取时间
+        now = datetime.now().isoformat()
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if ':' in line:
+                    key, value = line.strip().split(':', 1)
+                    memories[key.strip()] = {
+                        "value": value.strip(),
+                        "timestamp": now
+                    }
+    else:
+        raise ValueError(f"不支持的记忆格式: {file_format}")
+    return memories
+
+
+def write_memory_file(file_path, file_format, items):
+    """把 (key, data) 序列写入一个记忆文件
+
+    先写同目录下的临时文件再原子地重命名，读者只会看到完整的旧文件或新文件。
+    """
+    if file_format not in MEMORY_FORMATS:
+        raise ValueError(f"不支持的记忆格式: {file_format}")
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    try:
+        if file_format == "json":
+            # 逐条编码写出，不先拼成一个完整的字典（紧凑存储落盘时不会瞬间膨胀）
+            encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write("{")
+                for i, (key, data) in enumerate(items):
+                    f.write(("," if i else "") + encode(key) + ":" + encode(data))
+                f.write("}")
+
+        elif file_format == "csv":
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['key', 'value', 'timestamp'])
+                for key, data in items:
+                    writer.writerow([key, data['value'], data.get('timestamp', '')])
+
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key, data in items:
+                    f.write(f"{key}: {data['value']}\n")
+
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def apply_log_record(memories, record):
+    """把一条追加日志记录（写入或删除）套用到记忆字典上"""
+    if record.get("op") == "del":
+        memories.pop(record["key"], None)
+    else:
+        memories[record["key"]] = {
+            "value": record["value"],
+            "timestamp": record.get("timestamp", "")
+        }
+
+
+# === 存储后端接口 ===
+class MemoryBackend:
+    """记忆存储后端
+
+    load() 返回 key -> {"value", "timestamp"} 的映射，put_many/delete 修改存储，
+    search 返回与问题相关的关键词（按相关度排序）。
+    """
+    name = "base"
+    # 每次从存储重新加载（包括写入时发现外部改动后的原地重新加载）加一，
+    # 上层据此重建自己维护的索引
+    generation = 0
+
+    def load(self):
+        raise NotImplementedError
+
+    def put_many(self, records):
+        """写入若干 (key, value, timestamp)"""
+        raise NotImplementedError
+
+    def begin_import(self):
+        """开始批量导入：之后的 import_batch 只合并，commit_import 时统一落盘一次"""
+        self.pending_import = []
+
+    def import_batch(self, records):
+        self.pending_import.extend(records)
+
+    def commit_import(self):
+        records, self.pending_import = self.pending_import, []
+        return self.put_many(records)
+
+    def abort_import(self):
+        self.pending_import = []
+
+    def delete(self, key):
+        return self.delete_many([key])
+
+    def delete_many(self, keys):
+        """删除若干关键词，只落盘一次；全部不存在时返回 False"""
+        raise NotImplementedError
+
+    def search(self, query, limit=None):
+        raise NotImplementedError
+
+    def filter_keys(self, text):
+        """返回包含 text 的关键词（不区分大小写），text 为空时返回全部"""
+        raise NotImplementedError
+
+    def compact(self):
+        return True
+
+    def signature(self):
+        """存储文件的 (mtime, size) 指纹，用于发现其他进程的改动；None 表示无需检查"""
+        return None
+
+    def shard_lock(self):
+        """返回保护整个存储分片的锁（上下文管理器），用于在后端之外写分片文件"""
+        return contextlib.nullcontext()
+
+    def mark_synced(self):
+        """记录本进程写完后的存储状态"""
+        pass
+
+    def flush(self):
+        """把延迟写入的改动立即落盘（写后模式之外无事可做）"""
+        return True
+
+    def is_stale(self):
+        """存储是否在本进程之外被修改过"""
+        return False
+
+    def close(self):
+        pass
+
+
+# === 文件后端：json/csv/txt 快照 + 追加日志 ===
+class FileMemoryBackend(MemoryBackend):
+    name = "file"
+
+    def __init__(self, memory_file="ai_memory", default_format="json",
+                 journal=True, compact_threshold=1000,
+                 write_behind=False, flush_interval=0.5, flush_max_changes=100,
+                 compact_store=False, binary_snapshot=True):
+        self.memory_file = memory_file
+        self.default_format = default_format
+        # 日志模式：每次 remember/delete 只向日志追加一条记录，
+        # 完整的 json/csv/txt 快照只在压缩或导出时生成
+        self.journal = journal
+        self.compact_threshold = compact_threshold
+        self.log_entries = 0
+        # 关键词索引由 put_many/delete 增量维护，load 时重建
+        self.index = KeywordIndex()
+        # 紧凑存储：记忆按列存放（CompactMemoryStore），大记忆库时内存占用更小
+        self.compact_store = compact_store
+        self.memories = self.new_store()
+        # 压缩时额外写一份二进制快照（.bin），启动时优先用 mmap 加载，过期或缺失时回退到文本快照。
+        # 只对紧凑存储有效：值可以留在 mmap 里惰性解码；普通字典要逐条构建，反而比 json.load 慢
+        self.binary_snapshot = binary_snapshot and compact_store
+        # 本进程最近一次读写后的文件指纹
+        self.synced_signature = None
+        # 跨进程的分片锁：加载、追加日志和重写快照都要先拿到它
+        self.file_lock = ShardLock(f"{memory_file}.lock")
+        # 写后模式：remember/delete 只改内存并标记为脏，由后台线程在 flush_interval 秒后
+        # 或攒够 flush_max_changes 次改动时合并落盘，不阻塞调用方
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_max_changes = flush_max_changes
+        # state_lock 保护内存字典和待写队列；后台线程只在复制数据时短暂持有
+        self.state_lock = threading.RLock()
+        self.flush_ready = threading.Condition(self.state_lock)
+        self.flush_lock = threading.RLock()
+        self.pending_log = []
+        # 已合并进内存、正在写入日志的批次（flush 取走的待写队列、非写后模式的一次写入），
+        # 写入前原地重新加载时要重新套用
+        self.inflight = []
+        self.pending_changes = 0
+        self.dirty = False
+        self.flusher = None
+        self.closing = False
+        self.write_stats = {"mutations": 0, "flushes": 0, "coalesced_writes": 0,
+                            "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0}
+
+    def get_file_path(self, file_format=None):
+        """获取文件路径"""
+        if file_format is None:
+            file_format = self.default_format
+        return f"{self.memory_file}.{file_format}"
+
+    def new_store(self):
+        return CompactMemoryStore() if self.compact_store else {}
+
+    def copy_items(self):
+        """复制当前全部 (key, data) 用于落盘（调用方持有 state_lock）"""
+        if self.compact_store:
+            return self.memories.snapshot()
+        return list(self.memories.items())
+
+    def get_log_path(self):
+        """获取追加日志路径"""
+        return f"{self.memory_file}.log"
+
+    def get_binary_path(self):
+        """获取二进制快照路径"""
+        return f"{self.memory_file}.bin"
+
+    def source_signature(self):
+        """默认格式文本快照的 (mtime_ns, size)，二进制快照以此判断是否过期"""
+        try:
+            stat = os.stat(self.get_file_path())
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def signature(self):
+        paths = [self.get_file_path(fmt) for fmt in MEMORY_FORMATS] + [self.get_log_path()]
+        result = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                result.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                result.append(None)
+        return tuple(result)
+
+    def mark_synced(self):
+        """记录本进程写完后的文件指纹，自己的写入不算外部改动"""
+        self.synced_signature = self.signature()
+
+    def shard_lock(self):
+        return self.file_lock.writing()
+
+    def is_stale(self):
+        return self.signature() != self.synced_signature
+
+    def load(self):
+        """加载快照并回放追加日志"""
+        # 先把还没落盘的改动写出去，否则重新加载会丢掉它们
+        self.flush()
+        with self.file_lock:
+            self.memories = self.load_snapshot()
+            self.log_entries = self.replay_log(self.memories)
+            self.mark_synced()
+        self.index.build(self.memories)
+        self.generation += 1
+        return self.memories
+
+    def load_snapshot(self):
+        """加载快照文件"""
+        if self.binary_snapshot:
+            source = self.source_signature()
+            store = load_snapshot(self.get_binary_path(), source) if source else None
+            if store is not None:
+                return store
+        # 尝试按优先级加载不同格式的文件
+        formats_to_try = [self.default_format] + MEMORY_FORMATS
+
+        for file_format in formats_to_try:
+            file_path = self.get_file_path(file_format)
+            if os.path.exists(file_path):
+                try:
+                    if not self.compact_store:
+                        return read_memory_file(file_path, file_format)
+                    # 紧凑存储边解析边写入，不经过完整的字典
+                    store = CompactMemoryStore()
+                    with open(file_path, 'rb') as f:
+                        for key, value, timestamp in iter_memory_records(f, file_format, missing_timestamp=""):
+                            store.put(key, value, timestamp)
+                    return store
+                except Exception as e:
+                    print(f"加载{file_format}格式记忆失败: {e}")
+                    continue
+
+        # 如果没有找到任何文件，返回空字典
+        return self.new_store()
+
+    def replay_log(self, memories):
+        """把追加日志回放到记忆字典上，返回回放的记录数"""
+        log_path = self.get_log_path()
+        if not os.path.exists(log_path):
+            return 0
+
+        count = 0
+        try:
+            with open(log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 进程中断时最后一行可能只写了一半，直接跳过
+                        continue
+                    apply_log_record(memories, record)
+                    count += 1
+        except Exception as e:
+            print(f"回放记忆日志失败: {e}")
+        return count
+
+    def append_log(self, records):
+        """向追加日志写入若干条记录"""
+        with self.file_lock.writing():
+            # 其他进程写过这个分片时保持“过期”状态，压缩前由 compact 读回它们的改动
+            external = self.is_stale()
+            try:
+                with open(self.get_log_path(), 'a', encoding='utf-8') as f:
+                    f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            except Exception as e:
+                print(f"写入记忆日志失败: {e}")
+                return False
+
+            if not external:
+                self.mark_synced()
+            self.log_entries += len(records)
+            if self.log_entries >= max(self.compact_threshold, len(self.memories)):
+                return self.compact()
+            return True
+
+    def reload_in_place(self):
+        """从磁盘重新读取快照和日志，原地更新记忆字典（调用方持有的引用仍然有效）
+
+        调用方持有 file_lock。本进程还没写进日志的改动（待写队列和正在写入的批次）
+        比磁盘上的都新，读回后重新套用，不会在内存中丢失。
+        """
+        memories = self.load_snapshot()
+        self.log_entries = self.replay_log(memories)
+        with self.state_lock:
+            for batch in self.inflight:
+                for record in batch:
+                    apply_log_record(memories, record)
+            for record in self.pending_log:
+                apply_log_record(memories, record)
+            self.memories.clear()
+            self.memories.update(memories)
+            self.index.build(self.memories)
+            self.generation += 1
+        self.mark_synced()
+
+    def save_snapshot(self, file_format, items=None):
+        """把当前记忆写成一个格式的快照"""
+        if items is None:
+            with self.state_lock:
+                items = self.copy_items()
+        try:
+            write_memory_file(self.get_file_path(file_format), file_format, items)
+            return True
+        except Exception as e:
+            print(f"保存{file_format}格式记忆失败: {e}")
+            return False
+
+    def save_all(self, items=None):
+        """重写所有格式的快照"""
+        success = True
+        # 只在复制时持有 state_lock，写文件期间其他线程仍可修改内存
+        if items is None:
+            with self.state_lock:
+                items = self.copy_items()
+        with self.file_lock.writing():
+            for fmt in MEMORY_FORMATS:
+                if not self.save_snapshot(fmt, items):
+                    success = False
+            self.mark_synced()
+        return success
+
+    def compact(self):
+        """压缩：生成完整快照并清空追加日志"""
+        with self.file_lock.writing():
+            # 其他进程写过这个分片（可能只写进了日志）：先读回它们的改动，否则快照会覆盖掉
+            if self.is_stale():
+                self.reload_in_place()
+            with self.state_lock:
+                items = self.copy_items()
+            success = self.save_all(items)
+            # 只有快照全部写成功才能丢弃日志，否则下次启动仍可回放
+            if success:
+                try:
+                    with open(self.get_log_path(), 'w', encoding='utf-8'):
+                        pass
+                    self.log_entries = 0
+                except Exception as e:
+                    print(f"清空记忆日志失败: {e}")
+                    success = False
+                self.mark_synced()
+            if success and self.binary_snapshot:
+                self.save_binary(items)
+        return success
+
+    def save_binary(self, items):
+        """写二进制快照；失败不影响文本快照，下次启动回退到文本快照即可"""
+        source = self.source_signature()
+        if source is None:
+            return False
+        try:
+            write_snapshot(self.get_binary_path(), iter_snapshot_records(items), source)
+            return True
+        except Exception as e:
+            print(f"保存二进制记忆快照失败: {e}")
+            return False
+
+    def merge(self, records):
+        """把记录合并进内存字典和索引（不落盘）"""
+        with self.state_lock:
+            for key, value, timestamp in records:
+                self.memories[key] = {
+                    "value": value,
+                    "timestamp": timestamp
+                }
+                self.index.add(key)
+
+    def put_many(self, records):
+        records = list(records)
+        if self.write_behind:
+            with self.state_lock:
+                self.merge(records)
+                return self.defer([
+                    {"op": "set", "key": key, "value": value, "timestamp": timestamp}
+                    for key, value, timestamp in records
+                ])
+        if self.journal:
+            log_records = [
+                {"op": "set", "key": key, "value": value, "timestamp": timestamp}
+                for key, value, timestamp in records
+            ]
+            with self.state_lock:
+                self.merge(records)
+                self.inflight.append(log_records)
+            # 一次写入全部记录；日志过长时会自动压缩
+            return self.append_inflight(log_records)
+        self.merge(records)
+        # 保存到所有格式（确保数据同步）
+        return self.save_all()
+
+    def begin_import(self):
+        # 导入前先落盘延迟的改动：导入提交时可能直接生成快照，之后再追加旧日志会覆盖导入的值
+        self.flush()
+        # 导入量达到压缩阈值后不再保留待写日志，提交时直接生成快照
+        self.pending_import = []
+
+    def import_batch(self, records):
+        self.merge(records)
+        if self.pending_import is not None:
+            self.pending_import.extend(records)
+            if len(self.pending_import) >= self.compact_threshold:
+                self.pending_import = None
+
+    def commit_import(self):
+        records, self.pending_import = self.pending_import, []
+        if not self.journal:
+            return self.save_all()
+        if records is None or self.log_entries + len(records) >= max(self.compact_threshold, len(self.memories)):
+            return self.compact()
+        return self.append_log([
+            {"op": "set", "key": key, "value": value, "timestamp": timestamp}
+            for key, value, timestamp in records
+        ])
+
+    def abort_import(self):
+        # 已合并进内存的部分还没落盘，由调用方重新 load() 丢弃
+        self.pending_import = []
+
+    def delete_many(self, keys):
+        with self.state_lock:
+            removed = [key for key in dict.fromkeys(keys) if key in self.memories]
+            if not removed:
+                return False
+            for key in removed:
+                del self.memories[key]
+                self.index.remove(key)
+            log_records = [{"op": "del", "key": key} for key in removed]
+            if self.write_behind:
+                return self.defer(log_records)
+            if self.journal:
+                self.inflight.append(log_records)
+        if self.journal:
+            return self.append_inflight(log_records)
+        return self.save_all()
+
+    def search(self, query, limit=None):
+        return self.index.search(query, limit)
+
+    def filter_keys(self, text):
+        if not text:
+            return list(self.memories)
+        return self.index.filter(text)
+
+    def append_inflight(self, records):
+        """写入已登记在 inflight 中的一批日志记录，写完（无论成败）后注销"""
+        try:
+            return self.append_log(records)
+        finally:
+            with self.state_lock:
+                self.inflight.remove(records)
+
+    # --- 写后模式 ---
+    def defer(self, log_records):
+        """记录一次待写改动，必要时启动或唤醒后台刷新线程（调用方持有 state_lock）"""
+        if self.journal:
+            self.pending_log.extend(log_records)
+        self.pending_changes += 1
+        self.dirty = True
+        self.write_stats["mutations"] += 1
+        if self.flusher is None:
+            self.closing = False
+            self.flusher = threading.Thread(target=self.flush_loop, name="memory-flush", daemon=True)
+            self.flusher.start()
+        elif self.pending_changes >= self.flush_max_changes:
+            self.flush_ready.notify()
+        return True
+
+    def flush_loop(self):
+        """后台线程：等到间隔结束或改动攒够再落盘，没有新改动时退出"""
+        while True:
+            with self.flush_ready:
+                deadline = time.monotonic() + self.flush_interval
+                while not self.closing and self.pending_changes < self.flush_max_changes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.flush_ready.wait(remaining)
+            self.flush()
+            with self.flush_ready:
+                if self.closing or not self.dirty:
+                    self.flusher = None
+                    return
+
+    def flush(self):
+        """把待写改动一次性落盘：日志模式追加一批记录，否则原子地重写全部快照"""
+        with self.flush_lock:
+            with self.state_lock:
+                if not self.dirty:
+                    return True
+                records, self.pending_log = self.pending_log, []
+                changes, self.pending_changes = self.pending_changes, 0
+                self.dirty = False
+                if self.journal:
+                    self.inflight.append(records)
+
+            start = time.perf_counter()
+            success = self.append_log(records) if self.journal else self.save_all()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            with self.state_lock:
+                if self.journal:
+                    self.inflight.remove(records)
+                if not success:
+                    # 写失败时放回队列，下次刷新重试
+                    self.pending_log[:0] = records
+                    self.pending_changes += changes
+                    self.dirty = True
+                    return False
+                stats = self.write_stats
+                stats["flushes"] += 1
+                stats["coalesced_writes"] += changes - 1
+                stats["last_flush_ms"] = elapsed_ms
+                stats["max_flush_ms"] = max(stats["max_flush_ms"], elapsed_ms)
+                stats["total_flush_ms"] += elapsed_ms
+            return True
+
+    def close(self):
+        """停止后台线程并落盘全部改动（进程退出前调用）"""
+        with self.flush_ready:
+            self.closing = True
+            self.flush_ready.notify()
+            flusher = self.flusher
+        if flusher is not None:
+            flusher.join()
+        return self.flush()
+
+
+# === SQLite 后端：WAL + FTS5 三元组索引 ===
+class SQLiteMemoryView(Mapping):
+    """以只读映射的形式访问 SQLite 中的记忆，不把整张表读进内存"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getitem__(self, key):
+        row = self.backend.query_one(
+            "SELECT value, timestamp FROM memories WHERE key = ?", (key,))
+        if row is None:
+            raise KeyError(key)
+        return {"value": row[0], "timestamp": row[1]}
+
+    def __contains__(self, key):
+        return self.backend.query_one("SELECT 1 FROM memories WHERE key = ?", (key,)) is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in self.backend.query_all("SELECT key FROM memories ORDER BY rowid")])
+
+    def __len__(self):
+        return self.backend.query_one("SELECT count(*) FROM memories")[0]
+
+    def items(self):
+        rows = self.backend.query_all("SELECT key, value, timestamp FROM memories ORDER BY rowid")
+        return [(key, {"value": value, "timestamp": timestamp}) for key, value, timestamp in rows]
+
+
+class SQLiteMemoryBackend(MemoryBackend):
+    name = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS memories (
+        key TEXT PRIMARY KEY,
+        lkey TEXT NOT NULL,
+        value TEXT NOT NULL,
+        timestamp TEXT NOT NULL DEFAULT ''
+    );
+    CREATE INDEX IF NOT EXISTS memories_lkey ON memories (lkey);
+    CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+        lkey, content='memories', content_rowid='rowid', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
+        INSERT INTO memories_fts (rowid, lkey) VALUES (new.rowid, new.lkey);
+    END;
+    CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+        INSERT INTO memories_fts (memories_fts, rowid, lkey) VALUES ('delete', old.rowid, old.lkey);
+    END;
+    CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE ON memories BEGIN
+        INSERT INTO memories_fts (memories_fts, rowid, lkey) VALUES ('delete', old.rowid, old.lkey);
+        INSERT INTO memories_fts (rowid, lkey) VALUES (new.rowid, new.lkey);
+    END;
+    """
+
+    # 三元组分词器最短只能匹配 3 个字符，更短的关键词走普通索引
+    GRAM_SIZE = 3
+
+    def __init__(self, db_path="ai_memory.db", batch_size=1000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.lock = threading.RLock()
+        # Streamlit 的多个会话在不同线程里共用这一个连接，由 lock 串行化
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.mark_synced()
+
+    def query_one(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def query_all(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def load(self):
+        with self.lock:
+            self.mark_synced()
+            self.generation += 1
+        return SQLiteMemoryView(self)
+
+    def data_version(self):
+        """PRAGMA data_version：其他连接（包括其他进程）提交改动后变化，本连接自己的提交不变"""
+        return self.query_one("PRAGMA data_version")[0]
+
+    def mark_synced(self):
+        self.synced_version = self.data_version()
+
+    def is_stale(self):
+        return self.data_version() != self.synced_version
+
+    def reload_in_place(self):
+        """读回其他连接的改动：映射本身直接查库，只需让上层重建自己的索引"""
+        with self.lock:
+            self.generation += 1
+            self.mark_synced()
+
+    def sync_after_write(self, external):
+        """本连接写完后：写之前已有外部改动时原地重新加载（与文件后端一致）"""
+        if external:
+            self.reload_in_place()
+
+    UPSERT_SQL = ("INSERT INTO memories (key, lkey, value, timestamp) VALUES (?, ?, ?, ?) "
+                  "ON CONFLICT(key) DO UPDATE SET value = excluded.value, timestamp = excluded.timestamp")
+
+    def put_many(self, records):
+        """在一个事务里分批写入"""
+        try:
+            with self.lock:
+                external = self.is_stale()
+                with self.conn:
+                    batch = []
+                    for key, value, timestamp in records:
+                        batch.append((key, key.lower(), value, timestamp))
+                        if len(batch) >= self.batch_size:
+                            self.conn.executemany(self.UPSERT_SQL, batch)
+                            batch = []
+                    if batch:
+                        self.conn.executemany(self.UPSERT_SQL, batch)
+                self.sync_after_write(external)
+            return True
+        except sqlite3.Error as e:
+            print(f"写入SQLite记忆失败: {e}")
+            return False
+
+    def begin_import(self):
+        # 导入期间独占连接，所有批次在同一个事务里，commit_import 时提交
+        self.lock.acquire()
+        self.import_external = self.is_stale()
+
+    def import_batch(self, records):
+        self.conn.executemany(self.UPSERT_SQL, [
+            (key, key.lower(), value, timestamp) for key, value, timestamp in records
+        ])
+
+    def commit_import(self):
+        try:
+            self.conn.commit()
+            self.sync_after_write(self.import_external)
+            return True
+        except sqlite3.Error as e:
+            print(f"提交SQLite导入失败: {e}")
+            self.conn.rollback()
+            return False
+        finally:
+            self.lock.release()
+
+    def abort_import(self):
+        try:
+            self.conn.rollback()
+        finally:
+            self.lock.release()
+
+    def delete_many(self, keys):
+        try:
+            with self.lock:
+                external = self.is_stale()
+                with self.conn:
+                    cursor = self.conn.executemany(
+                        "DELETE FROM memories WHERE key = ?", [(key,) for key in keys])
+                self.sync_after_write(external)
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            print(f"删除SQLite记忆失败: {e}")
+            return False
+
+    def filter_keys(self, text):
+        text = text.lower()
+        if not text:
+            sql, params = "SELECT key FROM memories ORDER BY rowid", ()
+        elif len(text) >= self.GRAM_SIZE:
+            sql = ("SELECT m.key FROM memories_fts JOIN memories m ON m.rowid = memories_fts.rowid "
+                   "WHERE memories_fts MATCH ? ORDER BY m.rowid")
+            params = (self.fts_phrase(text),)
+        else:
+            sql, params = "SELECT key FROM memories WHERE instr(lkey, ?) > 0 ORDER BY rowid", (text,)
+        return [row[0] for row in self.query_all(sql, params)]
+
+    @staticmethod
+    def fts_phrase(text):
+        """把文本转成 FTS5 短语（双引号转义）"""
+        return '"' + text.replace('"', '""') + '"'
+
+    def search(self, query, limit=None):
+        text = query.lower()
+        n = self.GRAM_SIZE
+        # 小写关键词 -> 匹配长度
+        matches = {}
+        with self.lock:
+            # 关键词包含在问题里：长关键词用问题的三元组召回候选再用 instr 校验，
+            # 短关键词直接查问题的全部 1~2 字子串
+            grams = {text[i:i + n] for i in range(len(text) - n + 1)}
+            if grams:
+                rows = self.conn.execute(
+                    "SELECT m.lkey FROM memories_fts JOIN memories m ON m.rowid = memories_fts.rowid "
+                    "WHERE memories_fts MATCH ? AND instr(?, m.lkey) > 0",
+                    (" OR ".join(self.fts_phrase(g) for g in grams), text)
+                ).fetchall()
+                for (lkey,) in rows:
+                    matches[lkey] = len(lkey)
+            short = list({text[i:i + size] for size in range(n) for i in range(len(text) - size + 1)})
+            for start in range(0, len(short), 500):
+                chunk = short[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT lkey FROM memories WHERE lkey IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for (lkey,) in rows:
+                    matches[lkey] = len(lkey)
+
+            # 问题包含在关键词里
+            if len(text) >= n:
+                rows = self.conn.execute(
+                    "SELECT m.lkey FROM memories_fts JOIN memories m ON m.rowid = memories_fts.rowid "
+                    "WHERE memories_fts MATCH ?", (self.fts_phrase(text),)
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT lkey FROM memories WHERE instr(lkey, ?) > 0", (text,)
+                ).fetchall()
+            for (lkey,) in rows:
+                matches[lkey] = max(len(text), matches.get(lkey, 0))
+
+            # 与 KeywordIndex 相同的排序：匹配越长越相关，同样长度时关键词越短越贴切
+            ranked = sorted(matches, key=lambda lkey: (-matches[lkey], len(lkey), lkey))
+            keys = []
+            for lkey in ranked:
+                rows = self.conn.execute(
+                    "SELECT key FROM memories WHERE lkey = ? ORDER BY key", (lkey,)).fetchall()
+                keys.extend(row[0] for row in rows)
+                if limit is not None and len(keys) >= limit:
+                    break
+        return keys if limit is None else keys[:limit]
+
+    def compact(self):
+        """把 WAL 合并回主库"""
+        try:
+            with self.lock:
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return True
+        except sqlite3.Error as e:
+            print(f"合并SQLite WAL失败: {e}")
+            return False
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,147 @@
+import fnmatch
+import heapq
+import re
+from datetime import datetime, timedelta
+
+EVICTION_POLICIES = ["lru", "lfu"]
+
+
+def entry_bytes(key, value):
+    """一条记忆计入容量的字节数（关键词和值的 UTF-8 长度）"""
+    return len(key.encode('utf-8')) + len(value.encode('utf-8'))
+
+
+# === 记忆容量限制与淘汰 ===
+class EvictionPolicy:
+    """按条数或字节数限制记忆容量，超出时按 LRU/LFU 淘汰；另可按关键词模式设置过期时间
+
+    访问统计（最近访问时间、命中次数）由 recall 和 get_relevant_memories 的命中更新，
+    只保存在进程内；从未访问过的记忆以写入时间作为最近访问时间、命中次数为 0。
+    超出上限时一次淘汰到上限的 low_water 比例，避免每次写入都全表排序。
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, policy="lru", ttl_rules=None,
+                 low_water=0.9, sweep_interval=300):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"不支持的淘汰策略: {policy}")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        # {关键词通配模式: 存活秒数} 或 [(模式, 秒数)]，按顺序取第一个匹配的规则
+        if isinstance(ttl_rules, dict):
+            ttl_rules = ttl_rules.items()
+        self.ttl_rules = [(pattern, re.compile(fnmatch.translate(pattern)), float(seconds))
+                          for pattern, seconds in (ttl_rules or [])]
+        self.low_water = low_water
+        # 过期检查的最小间隔（秒），检查要扫描全部关键词
+        self.sweep_interval = sweep_interval
+        self.last_sweep = None
+        # key -> [最近访问时间（ISO 字符串）, 命中次数]
+        self.access = {}
+        self.total_bytes = 0
+        self.stats = {"evicted_lru": 0, "evicted_lfu": 0, "expired": 0}
+
+    @property
+    def tracks_bytes(self):
+        return self.max_bytes is not None
+
+    def reset(self, memories):
+        """重新加载记忆后重算字节数（访问统计保留给仍然存在的关键词）"""
+        self.access = {key: stats for key, stats in self.access.items() if key in memories}
+        if self.tracks_bytes:
+            self.total_bytes = sum(entry_bytes(key, data["value"]) for key, data in memories.items())
+
+    def touch(self, keys):
+        """记录一次访问"""
+        now = datetime.now().isoformat()
+        for key in keys:
+            stats = self.access.get(key)
+            if stats is None:
+                self.access[key] = [now, 1]
+            else:
+                stats[0] = now
+                stats[1] += 1
+
+    def on_put(self, key, value, old_value):
+        if self.tracks_bytes:
+            self.total_bytes += entry_bytes(key, value)
+            if old_value is not None:
+                self.total_bytes -= entry_bytes(key, old_value)
+
+    def on_delete(self, key, old_value):
+        self.access.pop(key, None)
+        if self.tracks_bytes and old_value is not None:
+            self.total_bytes -= entry_bytes(key, old_value)
+
+    def over_limit(self, memories):
+        return ((self.max_entries is not None and len(memories) > self.max_entries)
+                or (self.max_bytes is not None and self.total_bytes > self.max_bytes))
+
+    def select_victims(self, memories):
+        """返回需要淘汰的关键词（按淘汰顺序）；未超出上限时返回空列表"""
+        if not self.over_limit(memories):
+            return []
+
+        def rank(key):
+            stats = self.access.get(key)
+            if stats is None:
+                stats = (memories[key].get("timestamp", ""), 0)
+            # LRU 按最近访问时间，LFU 按命中次数（相同时先淘汰更久没用的）
+            return (stats[0],) if self.policy == "lru" else (stats[1], stats[0])
+
+        target_entries = None
+        if self.max_entries is not None and len(memories) > self.max_entries:
+            target_entries = int(self.max_entries * self.low_water)
+        target_bytes = None
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            target_bytes = int(self.max_bytes * self.low_water)
+
+        count = len(memories) - target_entries if target_entries is not None else 0
+        victims = heapq.nsmallest(max(count, 1), memories, key=rank)
+        if target_bytes is not None:
+            # 按字节限制时条数事先未知：先按条数取一批，不够再整体排序
+            freed = sum(entry_bytes(key, memories[key]["value"]) for key in victims)
+            if self.total_bytes - freed > target_bytes:
+                victims, freed = [], 0
+                for key in sorted(memories, key=rank):
+                    if self.total_bytes - freed <= target_bytes and len(victims) >= count:
+                        break
+                    victims.append(key)
+                    freed += entry_bytes(key, memories[key]["value"])
+        self.stats[f"evicted_{self.policy}"] += len(victims)
+        return victims
+
+    def ttl_for(self, key):
+        for _, regex, seconds in self.ttl_rules:
+            if regex.match(key):
+                return seconds
+        return None
+
+    def is_expired(self, key, data, now=None):
+        """一条记忆是否已超过它的过期时间（没有匹配的规则或时间戳无法解析时不过期）"""
+        seconds = self.ttl_for(key)
+        if seconds is None:
+            return False
+        try:
+            written = datetime.fromisoformat(data.get("timestamp", ""))
+        except ValueError:
+            return False
+        if written.tzinfo is not None:
+            written = written.astimezone().replace(tzinfo=None)
+        return (now or datetime.now()) - written > timedelta(seconds=seconds)
+
+    def select_expired(self, memories, force=False):
+        """返回已过期的关键词；距上次检查不足 sweep_interval 秒时直接返回空列表
+
+        两次检查之间过期的记忆仍在存储里，读取时用 is_expired 逐条过滤。
+        """
+        if not self.ttl_rules:
+            return []
+        now = datetime.now()
+        if not force and self.last_sweep is not None \
+                and (now - self.last_sweep).total_seconds() < self.sweep_interval:
+            return []
+        self.last_sweep = now
+        expired = [key for key in memories if self.is_expired(key, memories[key], now)]
+        self.stats["expired"] += len(expired)
+        return expired
@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+# 增量解析 JSON 时每次读取的字符数
+JSON_CHUNK_SIZE = 1 << 16
+# 数字里可能出现的字符：缓冲区在数字中间截断时（如 "1." "1e"），raw_decode 只解析出前半段
+JSON_NUMBER_CHARS = set("0123456789.eE+-")
+
+
+# === 流式读取记忆文件（不落临时文件、不整体载入） ===
+def iter_json_items(f, chunk_size=JSON_CHUNK_SIZE):
+    """增量解析顶层 JSON 对象，逐个产出 (key, value)"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    state, key = "start", None
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("JSON 文件不完整")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        ch = buffer[pos]
+        if state == "start":
+            if ch != "{":
+                raise ValueError("JSON 记忆文件必须是一个对象")
+            pos += 1
+            state = "first_key"
+        elif state == "colon":
+            if ch != ":":
+                raise ValueError(f"JSON 格式错误：位置 {pos} 处缺少冒号")
+            pos += 1
+            state = "value"
+        elif state == "next":
+            if ch == "}":
+                return
+            if ch != ",":
+                raise ValueError(f"JSON 格式错误：位置 {pos} 处缺少逗号")
+            pos += 1
+            state = "key"
+        elif state == "first_key" and ch == "}":
+            return
+        else:
+            # 解析键或值；缓冲区内容不完整时读取更多再重试
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                item, end = None, None
+            truncated = end is not None and not eof and (
+                end == len(buffer)
+                or (isinstance(item, (int, float)) and not isinstance(item, bool)
+                    and all(c in JSON_NUMBER_CHARS for c in buffer[end:])))
+            if end is None or truncated:
+                if eof:
+                    raise ValueError(f"JSON 格式错误：位置 {pos} 处无法解析")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            pos = end
+            if state == "value":
+                yield key, item
+                state = "next"
+            else:
+                if not isinstance(item, str):
+                    raise ValueError("JSON 记忆文件的键必须是字符串")
+                key = item
+                state = "colon"
+
+
+def iter_memory_records(stream, file_format, missing_timestamp=None):
+    """从二进制流逐条产出 (key, value, timestamp)
+
+    没有时间的记录记为 missing_timestamp，None 表示读取时间（导入用；读自己的快照时传 ""，原样保留）。
+    """
+    # newline='' 让 csv 模块自己处理字段里的换行；utf-8-sig 兼容 Excel 导出的 BOM
+    f = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    now = datetime.now().isoformat()
+    missing = now if missing_timestamp is None else missing_timestamp
+    try:
+        if file_format == "json":
+            for key, data in iter_json_items(f):
+                if isinstance(data, dict):
+                    yield key, str(data['value']), data.get('timestamp') or missing
+                else:
+                    yield key, str(data), missing
+        elif file_format == "csv":
+            for row in csv.DictReader(f):
+                yield row['key'], row['value'], row.get('timestamp') or missing
+        elif file_format == "txt":
+            for line in f:
+                if ':' in line:
+                    key, value = line.strip().split(':', 1)
+                    yield key.strip(), value.strip(), now
+        else:
+            raise ValueError(f"不支持的记忆格式: {file_format}")
+    finally:
+        # 不关闭调用方传入的流（例如 Streamlit 的 UploadedFile）
+        f.detach()
@@ -0,0 +1,280 @@
+import heapq
+import zlib
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # 语义检索是可选功能，没有 NumPy 时只能用关键词检索
+    np = None
+
+
+# === 记忆关键词倒排索引 ===
+class KeywordIndex:
+    """记忆关键词索引：同时回答"关键词出现在问题里"和"问题出现在关键词里"两类查询"""
+
+    def __init__(self, gram_size=2):
+        self.gram_size = gram_size
+        # 小写关键词 -> 原始关键词集合（大小写不同的关键词会归到一起）
+        self.by_lower = {}
+        # 关键词长度计数，用于按长度切片匹配
+        self.length_counts = Counter()
+        # 字符 n-gram -> 小写关键词集合
+        self.grams = {}
+
+    def __len__(self):
+        return len(self.by_lower)
+
+    def iter_grams(self, text):
+        """生成文本的全部字符 n-gram（去重）"""
+        n = self.gram_size
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def clear(self):
+        """清空索引"""
+        self.by_lower.clear()
+        self.length_counts.clear()
+        self.grams.clear()
+
+    def build(self, keys):
+        """根据全部关键词重建索引"""
+        self.clear()
+        for key in keys:
+            self.add(key)
+
+    def add(self, key):
+        """加入一个关键词"""
+        lower = key.lower()
+        originals = self.by_lower.get(lower)
+        if originals is not None:
+            originals.add(key)
+            return
+        self.by_lower[lower] = {key}
+        self.length_counts[len(lower)] += 1
+        for gram in self.iter_grams(lower):
+            self.grams.setdefault(gram, set()).add(lower)
+
+    def remove(self, key):
+        """移除一个关键词"""
+        lower = key.lower()
+        originals = self.by_lower.get(lower)
+        if originals is None:
+            return
+        originals.discard(key)
+        if originals:
+            return
+        del self.by_lower[lower]
+        self.length_counts[len(lower)] -= 1
+        if not self.length_counts[len(lower)]:
+            del self.length_counts[len(lower)]
+        for gram in self.iter_grams(lower):
+            postings = self.grams.get(gram)
+            if postings is not None:
+                postings.discard(lower)
+                if not postings:
+                    del self.grams[gram]
+
+    def contained_in(self, text):
+        """返回出现在 text 中的小写关键词 -> 匹配长度（text 需已转小写）"""
+        found = {}
+        size = len(text)
+        for length in self.length_counts:
+            if length > size:
+                continue
+            for i in range(size - length + 1):
+                sub = text[i:i + length]
+                if sub in self.by_lower:
+                    found[sub] = length
+        return found
+
+    def containing(self, text):
+        """返回包含 text 的小写关键词 -> 匹配长度（text 需已转小写）"""
+        size = len(text)
+        if not self.length_counts or size > max(self.length_counts):
+            return {}
+        if size < self.gram_size:
+            # 查询太短无法用 n-gram 过滤，只能逐个比较
+            return {lower: size for lower in self.by_lower if text in lower}
+
+        postings = []
+        for gram in self.iter_grams(text):
+            candidates = self.grams.get(gram)
+            if not candidates:
+                return {}
+            postings.append(candidates)
+        # 从最短的倒排表开始验证候选
+        candidates = min(postings, key=len)
+        return {lower: size for lower in candidates if text in lower}
+
+    def filter(self, text):
+        """返回包含 text 的原始关键词（按关键词排序）"""
+        keys = []
+        for lower in self.containing(text.lower()):
+            keys.extend(self.by_lower[lower])
+        return sorted(keys)
+
+    def search(self, query, limit=None):
+        """返回与 query 相关的原始关键词，按匹配长度从高到低排序"""
+        text = query.lower()
+        matches = self.contained_in(text)
+        for lower, length in self.containing(text).items():
+            matches[lower] = max(length, matches.get(lower, 0))
+
+        # 匹配越长越相关，同样长度时关键词越短越贴切
+        order = lambda lower: (-matches[lower], len(lower), lower)
+        if limit is None:
+            ranked = sorted(matches, key=order)
+        else:
+            ranked = heapq.nsmallest(limit, matches, key=order)
+
+        keys = []
+        for lower in ranked:
+            keys.extend(sorted(self.by_lower[lower]))
+        return keys if limit is None else keys[:limit]
+
+
+# === 语义检索：字符 n-gram 哈希向量 + 余弦 top-k ===
+class SemanticIndex:
+    """把记忆编码成定长向量，按余弦相似度检索
+
+    向量是字符 1~2-gram 的特征哈希（带符号），完全离线、不需要模型；
+    能召回换了说法的问题，例如"我生日是哪天"命中"我的生日"。
+    全部向量放在一块连续的 float32 矩阵里，按行归一化，
+    remember/delete 时只改对应的一行，删除留下的空行由之后的写入复用。
+    """
+
+    def __init__(self, dim=256, gram_sizes=(1, 2), value_weight=0.5, min_score=0.3):
+        if np is None:
+            raise RuntimeError("语义检索需要安装 numpy")
+        self.dim = dim
+        self.gram_sizes = gram_sizes
+        # 值的 n-gram 权重（关键词为 1），让"我爱打篮球吗"也能命中"用户喜好: 篮球"
+        self.value_weight = value_weight
+        # 余弦相似度低于此值的结果不返回
+        self.min_score = min_score
+        self.vectors = np.zeros((1024, dim), dtype=np.float32)
+        # 行号 -> 关键词（空行为 None）、关键词 -> 行号
+        self.row_keys = []
+        self.rows = {}
+        self.free_rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def features(self, text, weight, out):
+        """把文本的 n-gram 哈希累加到 out（列号 -> 权重）"""
+        text = text.lower()
+        for n in self.gram_sizes:
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i:i + n].encode('utf-8'))
+                # 低位选列，最高位决定符号，减小哈希冲突带来的偏差
+                column = h % self.dim
+                out[column] = out.get(column, 0.0) + (weight if h & 0x80000000 else -weight)
+        return out
+
+    def encode(self, key, value=""):
+        """把一条记忆（或一个问题）编码成归一化向量"""
+        features = self.features(key, 1.0, {})
+        if value:
+            self.features(value, self.value_weight, features)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if features:
+            vector[list(features)] = list(features.values())
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+        return vector
+
+    def allocate_row(self):
+        if self.free_rows:
+            return self.free_rows.pop()
+        row = len(self.row_keys)
+        if row >= len(self.vectors):
+            # 容量翻倍，均摊 O(1)
+            grown = np.zeros((len(self.vectors) * 2, self.dim), dtype=np.float32)
+            grown[:row] = self.vectors[:row]
+            self.vectors = grown
+        self.row_keys.append(None)
+        return row
+
+    def clear(self):
+        self.vectors = np.zeros((1024, self.dim), dtype=np.float32)
+        self.row_keys = []
+        self.rows = {}
+        self.free_rows = []
+
+    def build(self, memories):
+        """根据 key -> {"value", ...} 重建索引"""
+        self.clear()
+        self.add_many((key, data["value"]) for key, data in memories.items())
+
+    def add(self, key, value):
+        self.add_many([(key, value)])
+
+    def add_many(self, items):
+        """加入或更新若干 (key, value)，最后对改动的行统一归一化"""
+        touched = []
+        for key, value in items:
+            row = self.rows.get(key)
+            if row is None:
+                row = self.allocate_row()
+                self.rows[key] = row
+                self.row_keys[row] = key
+            features = self.features(key, 1.0, {})
+            if value:
+                self.features(value, self.value_weight, features)
+            vector = self.vectors[row]
+            vector[:] = 0.0
+            vector[list(features)] = list(features.values())
+            touched.append(row)
+        if touched:
+            block = self.vectors[touched]
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.vectors[touched] = block / norms
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        # 清零的行与任何问题的相似度都是 0，不会被检索到
+        self.vectors[row] = 0.0
+        self.row_keys[row] = None
+        self.free_rows.append(row)
+
+    def top_k(self, scores, limit):
+        """从每行得分中取前 limit 个 (行号, 得分)，得分从高到低"""
+        size = scores.shape[-1]
+        if limit is None or limit >= size:
+            order = np.argsort(-scores, axis=-1)
+        else:
+            # argpartition 是 O(n)，只对选出的 limit 个排序
+            part = np.argpartition(-scores, limit - 1, axis=-1)[..., :limit]
+            picked = np.take_along_axis(scores, part, axis=-1)
+            order = np.take_along_axis(part, np.argsort(-picked, axis=-1), axis=-1)
+        return order, np.take_along_axis(scores, order, axis=-1)
+
+    def search_batch(self, queries, limit=None):
+        """批量检索：一次矩阵乘法算出全部问题的得分，返回与 queries 对应的关键词列表"""
+        if not queries:
+            return []
+        size = len(self.row_keys)
+        if not size or limit == 0:
+            return [[] for _ in queries]
+        matrix = np.stack([self.encode(query) for query in queries])
+        scores = matrix @ self.vectors[:size].T
+        order, ranked_scores = self.top_k(scores, limit)
+        results = []
+        for rows, row_scores in zip(order.tolist(), ranked_scores.tolist()):
+            keys = []
+            for row, score in zip(rows, row_scores):
+                if score < self.min_score:
+                    break
+                key = self.row_keys[row]
+                if key is not None:
+                    keys.append(key)
+            results.append(keys)
+        return results
+
+    def search(self, query, limit=None):
+        """返回与 query 语义相近的关键词，按相似度从高到低排序"""
+        return self.search_batch([query], limit)[0]
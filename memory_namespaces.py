@@ -0,0 +1,103 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from memory import MultiFormatMemory
+
+# 可以直接用作目录名的命名空间
+SAFE_NAMESPACE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+# === 按用户/会话划分的记忆命名空间 ===
+class MemoryNamespaces:
+    """每个命名空间（用户 ID 或会话 ID）一个独立的存储分片
+
+    分片是 root_dir 下的一个子目录，里面是该命名空间自己的 json/csv/txt 快照、
+    追加日志和锁文件（第一次写入时才创建），不同用户的写入互不竞争，也不会出现在彼此的提示词里。
+    内存中只保留最近使用的 max_active 个命名空间，其余的按 LRU 卸载，需要时再从磁盘加载。
+    """
+
+    def __init__(self, root_dir="memories", max_active=64, default_namespace="default",
+                 default_file="ai_memory", backend_factory=None, **memory_options):
+        self.root_dir = root_dir
+        self.max_active = max_active
+        # 默认命名空间沿用原来的全局记忆文件，升级前的记忆不会丢失
+        self.default_namespace = default_namespace
+        self.default_file = default_file
+        # backend_factory(分片文件前缀) 返回存储后端，None 表示文件后端
+        self.backend_factory = backend_factory
+        self.memory_options = memory_options
+        self.active = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"loads": 0, "unloads": 0}
+
+    def __len__(self):
+        return len(self.active)
+
+    def shard_path(self, namespace):
+        """命名空间对应的分片文件前缀（不含扩展名）"""
+        if namespace == self.default_namespace:
+            return self.default_file
+        if SAFE_NAMESPACE.match(namespace):
+            name = namespace
+        else:
+            # 含路径分隔符、中文等字符的 ID 取哈希作目录名，避免越出 root_dir
+            name = "h" + hashlib.sha256(namespace.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.root_dir, name, "ai_memory")
+
+    def get(self, namespace):
+        """返回命名空间的记忆系统，不在内存中时从它的分片加载"""
+        namespace = namespace or self.default_namespace
+        with self.lock:
+            memory = self.active.get(namespace)
+            if memory is not None:
+                self.active.move_to_end(namespace)
+                return memory
+
+        # 加载分片可能较慢，不占用全局锁；并发加载同一个命名空间时保留先放进去的那个
+        path = self.shard_path(namespace)
+        backend = None
+        if self.backend_factory:
+            # 自定义后端（如 SQLite）打开时就要建库文件；文件后端在第一次写入时才创建分片目录
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            backend = self.backend_factory(path)
+        loaded = MultiFormatMemory(memory_file=path, backend=backend, **self.memory_options)
+
+        evicted = []
+        with self.lock:
+            memory = self.active.get(namespace)
+            if memory is None:
+                memory = loaded
+                self.active[namespace] = memory
+                self.stats["loads"] += 1
+                loaded = None
+            else:
+                self.active.move_to_end(namespace)
+            while len(self.active) > self.max_active:
+                evicted.append(self.active.popitem(last=False)[1])
+                self.stats["unloads"] += 1
+        if loaded is not None:
+            loaded.backend.close()
+        # 卸载的命名空间落盘延迟写入、停止刷新线程并释放文件/连接；
+        # 在它自己的锁内关闭，正在进行的读写先完成
+        for unloaded in evicted:
+            with unloaded.lock:
+                unloaded.backend.close()
+        return memory
+
+    def flush(self):
+        """落盘全部已加载命名空间的延迟写入"""
+        with self.lock:
+            memories = list(self.active.values())
+        return all([memory.flush() for memory in memories])
+
+    def close(self):
+        with self.lock:
+            memories = list(self.active.values())
+            self.active.clear()
+        for memory in memories:
+            memory.backend.close()
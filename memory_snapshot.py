@@ -0,0 +1,147 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from memory_store import CompactMemoryStore, parse_timestamp
+
+# === 二进制快照（冷启动用） ===
+# 文件布局（小端）：
+#   头部    MAGIC | 版本 | 条数 | 来源文件 mtime_ns | 来源文件大小 | 关键词区字节数 | 值区字节数 | 原始时间戳区字节数
+#   列数据  时间戳 int64 × n | 值偏移 int64 × n | 值长度 int64 × n | 关键词结束位置（字符）int64 × n
+#   关键词区  全部关键词拼接后的 UTF-8
+#   值区      全部值拼接后的 UTF-8，按偏移和长度就地解码
+#   原始时间戳区  {行号: 原始字符串} 的 JSON，只含整数列换不回原文的时间戳（通常为空）
+# 关键词在加载时一次性解码（索引需要），值留在 mmap 里，用到时才解码。
+SNAPSHOT_MAGIC = b"AIMEMBIN"
+SNAPSHOT_VERSION = 2
+HEADER = struct.Struct("<8sHxxIqqqqq")
+
+
+class MappedValues:
+    """值区的惰性解码器：按行号从 mmap 中切出 UTF-8 并解码"""
+
+    __slots__ = ("buffer", "base", "offsets", "lengths")
+
+    def __init__(self, buffer, base, offsets, lengths):
+        self.buffer = buffer
+        self.base = base
+        self.offsets = offsets
+        self.lengths = lengths
+
+    def decode(self, row):
+        start = self.base + self.offsets[row]
+        return str(self.buffer[start:start + self.lengths[row]], 'utf-8')
+
+
+def column_bytes(column):
+    """int64 列的小端字节"""
+    if sys.byteorder != "little":
+        column = array('q', column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def read_column(buffer, start, count):
+    column = array('q')
+    column.frombytes(buffer[start:start + count * 8])
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column, start + count * 8
+
+
+def write_snapshot(path, records, source_signature):
+    """把 (key, value, 整数时间戳, 原始时间戳或 None) 写成二进制快照（临时文件 + 原子重命名）
+
+    source_signature 是同时写出的文本快照的 (mtime_ns, size)，加载时据此判断是否过期。
+    """
+    timestamps, offsets, lengths, key_ends = array('q'), array('q'), array('q'), array('q')
+    keys, values, raw_stamps = [], [], {}
+    key_chars = value_bytes = 0
+    for row, (key, value, stamp, raw) in enumerate(records):
+        if raw is not None:
+            raw_stamps[row] = raw
+        encoded = value.encode('utf-8')
+        timestamps.append(stamp)
+        offsets.append(value_bytes)
+        lengths.append(len(encoded))
+        value_bytes += len(encoded)
+        values.append(encoded)
+        key_chars += len(key)
+        key_ends.append(key_chars)
+        keys.append(key)
+    key_blob = "".join(keys).encode('utf-8')
+    raw_blob = json.dumps(raw_stamps, ensure_ascii=False).encode('utf-8') if raw_stamps else b""
+    mtime_ns, size = source_signature
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(timestamps),
+                                mtime_ns, size, len(key_blob), value_bytes, len(raw_blob)))
+            for column in (timestamps, offsets, lengths, key_ends):
+                f.write(column_bytes(column))
+            f.write(key_blob)
+            f.writelines(values)
+            f.write(raw_blob)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def load_snapshot(path, source_signature):
+    """用 mmap 加载二进制快照为 CompactMemoryStore；文件不存在、版本不符或已过期时返回 None"""
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(buffer) < HEADER.size:
+        return None
+    magic, version, count, mtime_ns, size, key_bytes, value_bytes, raw_bytes = HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or (mtime_ns, size) != tuple(source_signature):
+        return None
+    if len(buffer) != HEADER.size + count * 32 + key_bytes + value_bytes + raw_bytes:
+        return None
+
+    position = HEADER.size
+    timestamps, position = read_column(buffer, position, count)
+    offsets, position = read_column(buffer, position, count)
+    lengths, position = read_column(buffer, position, count)
+    key_ends, position = read_column(buffer, position, count)
+    key_text = str(buffer[position:position + key_bytes], 'utf-8')
+    position += key_bytes
+
+    store = CompactMemoryStore()
+    intern = sys.intern
+    starts = [0]
+    starts.extend(key_ends)
+    store.rows = {intern(key_text[start:end]): row
+                  for row, (start, end) in enumerate(zip(starts, key_ends))}
+    store.values = [None] * count
+    store.timestamps = timestamps
+    if raw_bytes:
+        raw_start = position + value_bytes
+        raw_stamps = json.loads(str(buffer[raw_start:raw_start + raw_bytes], 'utf-8'))
+        store.raw_stamps = {int(row): raw for row, raw in raw_stamps.items()}
+    store.lazy_values = MappedValues(buffer, position, offsets, lengths)
+    return store
+
+
+def iter_snapshot_records(items):
+    """把 CompactSnapshot 或 (key, data) 序列统一转成 (key, value, 整数时间戳, 原始时间戳或 None)"""
+    records = getattr(items, "records", None)
+    if records is not None:
+        return records()
+    return (with_raw_stamp(key, data["value"], data.get("timestamp", "")) for key, data in items)
+
+
+def with_raw_stamp(key, value, timestamp):
+    stamp, exact = parse_timestamp(timestamp)
+    return key, value, stamp, None if exact else timestamp
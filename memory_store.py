@@ -0,0 +1,167 @@
+import sys
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+
+# 时间戳按本地"朴素时间"换算成自 1970-01-01 起的微秒数。带时区的先换算成本地时间，
+# 和 datetime.now().isoformat() 写下的时间戳（过期检查、增量合并都按它比较）一致；
+# 换不回原字符串的（带时区、显式的 .000000、无法解析的）由紧凑存储另存原文。
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+# 没有时间戳（例如 csv 里留空的时间列）或无法解析；比任何真实时间都早
+NO_TIMESTAMP = -(1 << 63)
+
+
+def parse_timestamp(timestamp):
+    """ISO 时间字符串 -> (微秒整数, int_to_timestamp 能否原样还原)"""
+    if not timestamp:
+        return NO_TIMESTAMP, timestamp == ""
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return NO_TIMESTAMP, False
+    exact = moment.tzinfo is None and moment.isoformat() == timestamp
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    # 直接按日期序数和时分秒计算，比 timedelta 相减再整除快约三倍（加载大记忆库时每条都要算）
+    seconds = (moment.toordinal() - EPOCH_ORDINAL) * 86400 + moment.hour * 3600 + moment.minute * 60 + moment.second
+    return seconds * 1000000 + moment.microsecond, exact
+
+
+def timestamp_to_int(timestamp):
+    """ISO 时间字符串 -> 微秒整数（用于比较先后）；空的或无法解析的返回 NO_TIMESTAMP"""
+    return parse_timestamp(timestamp)[0]
+
+
+def int_to_timestamp(value):
+    if value == NO_TIMESTAMP:
+        return ""
+    return (EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+# === 紧凑记忆存储 ===
+class CompactMemoryStore(MutableMapping):
+    """按列存放记忆的映射，接口与 {key: {"value", "timestamp"}} 相同
+
+    关键词（驻留字符串）-> 行号放在一个字典里，值放在列表里，时间戳是 array('q') 中的
+    整数微秒；省掉了每条记忆一个内层字典和一个时间字符串。读取时才临时拼出
+    {"value", "timestamp"} 字典，所以修改返回的字典不会写回存储，要整体赋值。
+    删除留下的空行由之后的写入复用。
+
+    从二进制快照加载时值还留在 mmap 里（lazy_values），values 中对应位置为 None，
+    第一次读取时才解码并缓存。整数换不回原字符串的时间戳，原文另存在 raw_stamps 里。
+    """
+
+    __slots__ = ("rows", "values", "timestamps", "raw_stamps", "free_rows", "lazy_values")
+
+    def __init__(self, items=None):
+        self.rows = {}
+        self.values = []
+        self.timestamps = array('q')
+        # 行号 -> 原始时间戳字符串（只存不能由整数原样还原的）
+        self.raw_stamps = {}
+        self.free_rows = []
+        self.lazy_values = None
+        if items:
+            self.update(items)
+
+    def value_at(self, row):
+        value = self.values[row]
+        if value is None and self.lazy_values is not None:
+            value = self.values[row] = self.lazy_values.decode(row)
+        return value
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __getitem__(self, key):
+        row = self.rows[key]
+        return {"value": self.value_at(row), "timestamp": self.timestamp_at(row)}
+
+    def timestamp_at(self, row):
+        raw = self.raw_stamps.get(row)
+        return raw if raw is not None else int_to_timestamp(self.timestamps[row])
+
+    def __setitem__(self, key, data):
+        self.put(key, data["value"], data.get("timestamp", ""))
+
+    def __delitem__(self, key):
+        row = self.rows.pop(key)
+        self.values[row] = None
+        self.raw_stamps.pop(row, None)
+        self.free_rows.append(row)
+
+    def put(self, key, value, timestamp):
+        """写入一条记忆，timestamp 是 ISO 字符串"""
+        stamp, exact = parse_timestamp(timestamp)
+        row = self.rows.get(key)
+        if row is None:
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                row = len(self.values)
+                self.values.append(None)
+                self.timestamps.append(NO_TIMESTAMP)
+            self.rows[sys.intern(key)] = row
+        self.values[row] = value
+        self.timestamps[row] = stamp
+        if exact:
+            self.raw_stamps.pop(row, None)
+        else:
+            self.raw_stamps[row] = timestamp
+
+    def get_value(self, key, default=None):
+        """只取值，不拼字典（recall 用）"""
+        row = self.rows.get(key)
+        return default if row is None else self.value_at(row)
+
+    def clear(self):
+        self.rows = {}
+        self.values = []
+        self.timestamps = array('q')
+        self.raw_stamps = {}
+        self.free_rows = []
+        self.lazy_values = None
+
+    def snapshot(self):
+        """复制一份当前内容用于落盘：只复制三列（每条约 24 字节），之后的修改不影响它
+
+        未解码的值仍从同一个 mmap 读取（快照文件被替换后旧映射依然有效）。
+        """
+        return CompactSnapshot(list(self.rows.items()), list(self.values), array('q', self.timestamps),
+                               dict(self.raw_stamps), self.lazy_values)
+
+
+class CompactSnapshot:
+    """CompactMemoryStore 的只读副本，可反复迭代出 (key, {"value", "timestamp"})"""
+
+    __slots__ = ("rows", "values", "timestamps", "raw_stamps", "lazy_values")
+
+    def __init__(self, rows, values, timestamps, raw_stamps=None, lazy_values=None):
+        self.rows = rows
+        self.values = values
+        self.timestamps = timestamps
+        self.raw_stamps = raw_stamps or {}
+        self.lazy_values = lazy_values
+
+    def __len__(self):
+        return len(self.rows)
+
+    def records(self):
+        """逐条产出 (key, value, 整数时间戳, 原始时间戳或 None)，写二进制快照时不必来回转换时间"""
+        values, timestamps, raw_stamps, lazy = self.values, self.timestamps, self.raw_stamps, self.lazy_values
+        for key, row in self.rows:
+            value = values[row]
+            if value is None and lazy is not None:
+                value = lazy.decode(row)
+            yield key, value, timestamps[row], raw_stamps.get(row)
+
+    def __iter__(self):
+        for key, value, stamp, raw in self.records():
+            yield key, {"value": value, "timestamp": raw if raw is not None else int_to_timestamp(stamp)}
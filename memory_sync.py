@@ -0,0 +1,213 @@
+import gzip
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+from memory_store import NO_TIMESTAMP, timestamp_to_int
+
+# 增量同步文件：gzip 压缩的 JSON 对象
+#   {"format": "ai_memory_delta", "version": 1, "since": 起始时间或 null, "until": 生成时间,
+#    "set": {key: {"value", "timestamp"}}, "deleted": {key: 删除时间}}
+# 下次导出时把上次的 until 作为 since，只包含这之后改动或删除的记忆。
+DELTA_FORMAT = "ai_memory_delta"
+DELTA_VERSION = 1
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+# === 删除记录（墓碑） ===
+class TombstoneLog:
+    """记录被删除的关键词和删除时间，增量同步时据此把删除传播到其他设备
+
+    存在 {memory_file}.tombstones 里，每行一条 JSON，只追加；
+    过期（超过 retention_days）或已被更新的写入覆盖的记录在行数过多时整理掉。
+    超过保留期没有同步过的设备，可能把已删除的记忆重新同步回来。
+    """
+
+    def __init__(self, path, retention_days=90):
+        self.path = path
+        self.retention_days = retention_days
+        # key -> 删除时间（ISO 字符串）
+        self.deleted = {}
+        self.lines = 0
+        self.load()
+
+    def load(self):
+        self.deleted, self.lines = {}, 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 最后一行可能写了一半
+                        continue
+                    self.lines += 1
+                    self.newer(entry["key"], entry["timestamp"])
+        except FileNotFoundError:
+            pass
+
+    def newer(self, key, timestamp):
+        """记下删除时间（只保留最新的），返回是否比已有的记录新"""
+        current = self.deleted.get(key)
+        if current is not None and timestamp_to_int(current) >= timestamp_to_int(timestamp):
+            return False
+        self.deleted[key] = timestamp
+        return True
+
+    def record(self, entries):
+        """追加删除记录 (key, 删除时间)，已有更新记录的忽略"""
+        lines = [json.dumps({"key": key, "timestamp": timestamp}, ensure_ascii=False) + "\n"
+                 for key, timestamp in entries if self.newer(key, timestamp)]
+        if not lines:
+            return
+        try:
+            # 分片目录在第一次写入时才创建，导入删除记录可能是这个分片的第一次写入
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+            self.lines += len(lines)
+        except OSError as e:
+            print(f"写入删除记录失败: {e}")
+
+    def get(self, key):
+        return self.deleted.get(key)
+
+    def since(self, since=NO_TIMESTAMP):
+        """产出 since（整数微秒）之后的删除记录 (key, 删除时间)"""
+        for key, timestamp in self.deleted.items():
+            if timestamp_to_int(timestamp) > since:
+                yield key, timestamp
+
+    def compact(self, memories):
+        """去掉过期的和已被重新写入的记录；行数不到有效记录两倍时不整理"""
+        cutoff = timestamp_to_int((datetime.now() - timedelta(days=self.retention_days)).isoformat())
+        live = {}
+        for key, timestamp in self.deleted.items():
+            stamp = timestamp_to_int(timestamp)
+            if stamp < cutoff:
+                continue
+            data = memories.get(key)
+            if data is not None and timestamp_to_int(data.get("timestamp", "")) > stamp:
+                continue
+            live[key] = timestamp
+        if self.lines < 2 * len(live) + 100:
+            return False
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for key, timestamp in live.items():
+                    f.write(json.dumps({"key": key, "timestamp": timestamp}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"整理删除记录失败: {e}")
+            return False
+        self.deleted, self.lines = live, len(live)
+        return True
+
+
+# === 增量导出/导入 ===
+def iter_changed(memories, since=NO_TIMESTAMP):
+    """产出时间戳晚于 since（整数微秒）的 (key, data)；since 为 NO_TIMESTAMP 时产出全部
+
+    紧凑存储直接比较时间戳列，不为每条记忆拼字典、解析时间字符串。
+    """
+    if since == NO_TIMESTAMP:
+        yield from list(memories.items())
+        return
+    rows = getattr(memories, "rows", None)
+    timestamps = getattr(memories, "timestamps", None)
+    if rows is not None and timestamps is not None:
+        for key, row in list(rows.items()):
+            if timestamps[row] > since:
+                yield key, memories[key]
+        return
+    for key, data in list(memories.items()):
+        if timestamp_to_int(data.get("timestamp", "")) > since:
+            yield key, data
+
+
+def write_delta(memories, tombstones, since=None):
+    """在内存中生成 gzip 压缩的增量文件，返回 (字节, until)
+
+    since 为 None 时导出全部记忆和删除记录；until 是本次的生成时间，作为下次导出的 since。
+    since 不是合法的 ISO 时间时抛出 ValueError。
+    """
+    until = datetime.now().isoformat()
+    if since:
+        datetime.fromisoformat(since)
+    since_int = timestamp_to_int(since) if since else NO_TIMESTAMP
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as raw:
+        # 逐条编码写入压缩流，不先拼出完整的字典
+        f = io.TextIOWrapper(raw, encoding='utf-8')
+        f.write('{"format":' + encode(DELTA_FORMAT) + ',"version":' + str(DELTA_VERSION)
+                + ',"since":' + encode(since or None) + ',"until":' + encode(until) + ',"set":{')
+        for i, (key, data) in enumerate(iter_changed(memories, since_int)):
+            f.write(("," if i else "") + encode(key) + ":"
+                    + encode({"value": data["value"], "timestamp": data.get("timestamp", "")}))
+        f.write('},"deleted":{')
+        separator = ""
+        for key, timestamp in tombstones.since(since_int):
+            # 删除后又重新写入的关键词不再带删除记录
+            data = memories.get(key)
+            if data is not None and timestamp_to_int(data.get("timestamp", "")) > timestamp_to_int(timestamp):
+                continue
+            f.write(separator + encode(key) + ":" + encode(timestamp))
+            separator = ","
+        f.write('}}')
+        f.flush()
+        f.detach()
+    return buffer.getvalue(), until
+
+
+def read_delta(stream):
+    """读取增量文件（gzip 压缩或未压缩的 JSON），格式不对时抛出 ValueError"""
+    data = stream.read()
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    delta = json.loads(data.decode('utf-8-sig'))
+    if not isinstance(delta, dict) or delta.get("format") != DELTA_FORMAT:
+        raise ValueError("不是增量同步文件")
+    if delta.get("version") != DELTA_VERSION:
+        raise ValueError(f"不支持的增量同步文件版本: {delta.get('version')}")
+    # 合并前先检查结构，格式不对的文件整体拒绝，不会只合并一部分
+    updates, deleted = delta.get("set", {}), delta.get("deleted", {})
+    if not isinstance(updates, dict) or not isinstance(deleted, dict):
+        raise ValueError("增量同步文件的 set/deleted 不是对象")
+    for key, data in updates.items():
+        if not isinstance(data, dict) or not isinstance(data.get("value"), str) \
+                or not isinstance(data.get("timestamp", ""), str):
+            raise ValueError(f"增量同步文件中的记忆格式不正确: {key}")
+    for key, timestamp in deleted.items():
+        if not isinstance(timestamp, str):
+            raise ValueError(f"增量同步文件中的删除记录格式不正确: {key}")
+    return delta
+
+
+def plan_merge(memories, tombstones, delta):
+    """按时间戳“后写者胜”决定要写入和删除的内容，返回 (写入记录, 删除记录)
+
+    写入记录是 (key, value, timestamp)，保留对方的时间戳；删除记录是 (key, 删除时间)。
+    本地记忆或删除记录的时间不早于对方时保留本地版本。
+    """
+    updates, deletes = [], []
+    for key, data in delta.get("set", {}).items():
+        stamp = timestamp_to_int(data.get("timestamp", ""))
+        local = memories.get(key)
+        if local is not None and timestamp_to_int(local.get("timestamp", "")) >= stamp:
+            continue
+        deleted_at = tombstones.get(key)
+        if deleted_at is not None and timestamp_to_int(deleted_at) >= stamp:
+            continue
+        updates.append((key, data["value"], data.get("timestamp", "")))
+    for key, timestamp in delta.get("deleted", {}).items():
+        stamp = timestamp_to_int(timestamp)
+        local = memories.get(key)
+        if local is not None and timestamp_to_int(local.get("timestamp", "")) >= stamp:
+            continue
+        deletes.append((key, timestamp))
+    return updates, deletes
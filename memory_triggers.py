@@ -0,0 +1,134 @@
+# === 记忆触发词匹配（Aho-Corasick 单遍扫描） ===
+
+class AhoCorasick:
+    """多模式匹配自动机：一次扫描找出文本中所有模式的出现位置"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        # 每个状态的转移表、失败指针和输出（以该状态结尾的模式下标）
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for index, pattern in enumerate(self.patterns):
+            self.add(pattern, index)
+        self.build()
+
+    def add(self, pattern, index):
+        state = 0
+        for ch in pattern:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(index)
+
+    def build(self):
+        """广度优先计算失败指针，并把失败链上的输出合并进来"""
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_all(self, text):
+        """返回所有匹配 (start, end, 模式下标)，按结束位置排序，可能互相重叠"""
+        matches = []
+        state = 0
+        goto, fail, output, patterns = self.goto, self.fail, self.output, self.patterns
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in output[state]:
+                matches.append((i + 1 - len(patterns[index]), i + 1, index))
+        return matches
+
+    def find_leftmost_longest(self, text):
+        """返回互不重叠的匹配：从左到右，同一起点取最长"""
+        selected = []
+        last_end = 0
+        for start, end, index in sorted(self.find_all(text), key=lambda m: (m[0], -m[1])):
+            if start >= last_end:
+                selected.append((start, end, index))
+                last_end = end
+        return selected
+
+
+# 触发词 -> 记忆关键词；None 表示"记住X是Y"这种由用户给出关键词的通用格式
+EXTRACTION_RULES = {
+    "我的名字": "用户姓名",
+    "我住在": "用户住址",
+    "我的生日": "用户生日",
+    "我喜欢": "用户喜好",
+    "记住": None,
+    "记一下": None,
+}
+# 不提取内容的触发词：出现在一条事实的内容之后时结束那条事实（"我喜欢猫，我不喜欢狗"）
+DETECTION_ONLY_TRIGGERS = ["我不喜欢", "我是"]
+
+# 一条事实的内容在这些标点处结束
+SENTENCE_ENDINGS = set("。！？!?；;\n")
+# 内容两端去掉的空白和逗号
+SEGMENT_STRIP = " \t\r，,、："
+
+TRIGGER_MATCHER = AhoCorasick(list(EXTRACTION_RULES) + DETECTION_ONLY_TRIGGERS)
+
+
+def find_triggers(text):
+    """返回消息中全部触发词及其位置 [(触发词, start, end)]"""
+    return [(TRIGGER_MATCHER.patterns[index], start, end)
+            for start, end, index in TRIGGER_MATCHER.find_leftmost_longest(text)]
+
+
+def extract_memory_facts(text):
+    """提取消息中的全部事实 [(关键词, 内容)]，按出现顺序排列"""
+    triggers = find_triggers(text)
+    facts = []
+    for position, (trigger, start, end) in enumerate(triggers):
+        if trigger not in EXTRACTION_RULES:
+            continue
+        # 内容到句末或下一个触发词为止；紧接在触发词后面的"我是"等只用于判断的触发词
+        # 是内容本身（"记住我是程序员"），不算下一个触发词
+        content_start = end
+        while content_start < len(text) and text[content_start] in SEGMENT_STRIP:
+            content_start += 1
+        stop = len(text)
+        for next_trigger, next_start, _ in triggers[position + 1:]:
+            if next_trigger in EXTRACTION_RULES or next_start > content_start:
+                stop = next_start
+                break
+        segment_end = end
+        while segment_end < stop and text[segment_end] not in SENTENCE_ENDINGS:
+            segment_end += 1
+        segment = text[end:segment_end].strip(SEGMENT_STRIP)
+
+        key = EXTRACTION_RULES[trigger]
+        if key is None:
+            # 通用记忆格式：记住[某某]是[什么]
+            name, sep, value = segment.partition("是")
+            if sep and name.strip() and value.strip():
+                facts.append((name.strip(), value.strip()))
+        elif key == "用户姓名":
+            # "我的名字是X"：只取"是"后面的部分
+            _, sep, value = segment.partition("是")
+            if sep and value.strip():
+                facts.append((key, value.strip()))
+        else:
+            if key == "用户生日" and segment.startswith("是"):
+                segment = segment[1:].strip()
+            if segment:
+                facts.append((key, segment))
+    return facts
+
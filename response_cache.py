@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+# === 回复缓存（进程内 LRU + 磁盘，带过期时间和容量上限） ===
+class ResponseCache:
+    def __init__(self, cache_dir=".response_cache", max_entries=256,
+                 ttl=24 * 3600, max_disk_bytes=50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        # key -> (写入时间, 回复)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "disk_evictions": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.disk_bytes = sum(e.stat().st_size for e in os.scandir(cache_dir) if e.is_file())
+
+    @staticmethod
+    def make_key(prompt, memories, system_prompt, history=()):
+        """由规范化后的问题、相关记忆、系统提示词（含对话摘要）和最近几轮对话生成缓存键
+
+        上下文原样参与计算：只有上下文完全相同时才复用回复，不会把别人对话里的内容
+        回给另一个用户；上下文相同的不同用户可以共享命中。
+        """
+        normalized = re.sub(r"\s+", " ", prompt).strip().lower()
+        digest = hashlib.sha256()
+        for part in (normalized, "\n".join(memories), system_prompt,
+                     json.dumps(list(history), ensure_ascii=False, sort_keys=True)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_file_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """查询缓存，未命中或已过期返回 None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self.entries[key]
+
+        file_path = self.get_file_path(key)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+
+        with self.lock:
+            if data is None or now - data["created"] > self.ttl:
+                if data is not None:
+                    self.remove_file(file_path)
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self.remember_entry(key, data["created"], data["response"])
+            return data["response"]
+
+    def put(self, key, response):
+        """写入缓存（内存和磁盘）"""
+        created = time.time()
+        content = json.dumps({"created": created, "response": response}, ensure_ascii=False)
+        file_path = self.get_file_path(key)
+        with self.lock:
+            self.remember_entry(key, created, response)
+            try:
+                if os.path.exists(file_path):
+                    self.disk_bytes -= os.path.getsize(file_path)
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                self.disk_bytes += os.path.getsize(file_path)
+            except OSError as e:
+                print(f"写入回复缓存失败: {e}")
+                return
+            if self.disk_bytes > self.max_disk_bytes:
+                self.evict_disk()
+
+    def remember_entry(self, key, created, response):
+        """放入内存 LRU，超出条数时淘汰最久未用的（需持有锁）"""
+        self.entries[key] = (created, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def remove_file(self, file_path):
+        """删除一个磁盘缓存文件并更新占用（需持有锁）"""
+        try:
+            size = os.path.getsize(file_path)
+            os.remove(file_path)
+            self.disk_bytes -= size
+        except OSError:
+            pass
+
+    def evict_disk(self):
+        """按修改时间从旧到新删除磁盘缓存，直到占用降到上限的 90%（需持有锁）"""
+        files = sorted(
+            (e for e in os.scandir(self.cache_dir) if e.is_file()),
+            key=lambda e: e.stat().st_mtime
+        )
+        target = self.max_disk_bytes * 0.9
+        for entry in files:
+            if self.disk_bytes <= target:
+                break
+            self.remove_file(entry.path)
+            self.stats["disk_evictions"] += 1
+
+    def hit_rate(self):
+        """命中率"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+from api_scheduler import ApiScheduler, AsyncApiScheduler
+from chat_core import ChatCore
+
+
+class RecordingClient:
+    """记录每次上游调用的问题，等 release 被设置后再返回"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def chat(self, messages, on_delta=None):
+        self.calls.append(messages[-1]["content"])
+        self.release.wait(5)
+        if on_delta is not None:
+            on_delta("好")
+        return "好", "success"
+
+
+class AsyncRecordingClient:
+    def __init__(self):
+        self.calls = []
+
+    async def chat(self, messages, on_delta=None):
+        self.calls.append(messages[-1]["content"])
+        await asyncio.sleep(0.01)
+        return messages[-1]["content"], "success"
+
+
+def ask(content):
+    return [{"role": "user", "content": content}]
+
+
+def test_identical_requests_share_one_upstream_call():
+    client = RecordingClient()
+    scheduler = ApiScheduler(client)
+    results, deltas = [], []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.chat(ask("同一个问题"), on_delta=deltas.append)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while scheduler.stats["coalesced"] < 2:
+        threading.Event().wait(0.01)
+    client.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert client.calls == ["同一个问题"]
+    assert results == [("好", "success")] * 3
+    assert deltas == ["好"] * 3
+
+
+def test_sessions_take_turns():
+    async def main():
+        client = AsyncRecordingClient()
+        scheduler = AsyncApiScheduler(client, max_concurrency=1)
+        # 会话 a 先连发四条（第一条直接放行），之后会话 b 的两条和 a 剩下的交替放行
+        tasks = [asyncio.ensure_future(scheduler.chat(ask(f"a{i}"), session_id="a")) for i in range(4)]
+        tasks += [asyncio.ensure_future(scheduler.chat(ask(f"b{i}"), session_id="b")) for i in range(2)]
+        await asyncio.gather(*tasks)
+        return client.calls
+
+    assert asyncio.run(main()) == ["a0", "a1", "b0", "a2", "b1", "a3"]
+
+
+def test_chat_core_queues_by_chat_session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    core = ChatCore({"ZHIPU_API_KEY": "k", "MEMORY_WRITE_BEHIND": "false"})
+    seen = []
+
+    class Scheduler:
+        def chat(self, messages, on_delta=None, session_id="default"):
+            seen.append(session_id)
+            return "好", "success"
+
+    core.get_scheduler = lambda api_key: Scheduler()
+    core.chat("default", "会话1", "你好")
+    core.chat("default", "会话2", "你好")
+    core.close()
+    assert seen == ["会话1", "会话2"]
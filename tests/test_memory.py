@@ -0,0 +1,20 @@
+from memory import MultiFormatMemory
+
+
+def test_export_keeps_other_process_journal_writes(tmp_path):
+    path = str(tmp_path / "ai_memory")
+    a = MultiFormatMemory(path)
+    b = MultiFormatMemory(path)
+    b.remember("b的键", "b的值")
+    assert a.export_memories("json")
+    a.compact()
+    assert "b的键" in MultiFormatMemory(path).memories
+
+
+def test_export_writes_its_own_file(tmp_path):
+    path = str(tmp_path / "ai_memory")
+    memory = MultiFormatMemory(path)
+    memory.remember("名字", "小明")
+    assert memory.export_memories("csv")
+    with open(memory.get_export_path("csv"), encoding="utf-8") as f:
+        assert "小明" in f.read()
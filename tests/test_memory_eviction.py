@@ -0,0 +1,60 @@
+from memory import MultiFormatMemory
+
+
+def make_memory(tmp_path, **options):
+    return MultiFormatMemory(str(tmp_path / "ai_memory"), **options)
+
+
+def put_old(memory, *keys, value="v"):
+    memory.put_records([(key, value, f"2024-05-01T10:00:0{i}") for i, key in enumerate(keys)])
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    memory = make_memory(tmp_path, max_entries=3, eviction="lru")
+    put_old(memory, "a", "b", "c")
+    assert memory.recall("a") == "v"
+    memory.remember("d", "v")
+    # 超出上限后一次淘汰到上限的 90%（2 条）
+    assert set(memory.memories) == {"a", "d"}
+    assert memory.eviction_stats()["evicted_lru"] == 2
+
+
+def test_lfu_evicts_least_frequently_used(tmp_path):
+    memory = make_memory(tmp_path, max_entries=3, eviction="lfu")
+    put_old(memory, "a", "b", "c")
+    memory.recall("a")
+    memory.recall("a")
+    memory.recall("c")
+    memory.remember("d", "v")
+    assert set(memory.memories) == {"a", "c"}
+    assert memory.eviction_stats()["evicted_lfu"] == 2
+
+
+def test_max_bytes_counts_utf8_bytes(tmp_path):
+    memory = make_memory(tmp_path, max_bytes=20)
+    # 每条 2 + 8 = 10 字节
+    put_old(memory, "k0", "k1", value="vvvvvvvv")
+    assert len(memory.memories) == 2
+    memory.put_records([("k2", "vvvvvvvv", "2024-05-01T10:00:09")])
+    assert set(memory.memories) == {"k2"}
+    assert memory.eviction_stats()["bytes"] == 10
+
+
+def test_limits_apply_on_load(tmp_path):
+    put_old(make_memory(tmp_path), "a", "b", "c", "d")
+    memory = make_memory(tmp_path, max_entries=2)
+    # 淘汰到 int(2 * 0.9) = 1 条，只留下最新的
+    assert set(memory.memories) == {"d"}
+
+
+def test_expired_entries_are_hidden_between_sweeps(tmp_path):
+    memory = make_memory(tmp_path, ttl_rules={"临时*": 60})
+    memory.put_records([("临时验证码", "1234", "2024-05-01T10:00:00"), ("名字", "小明", "2024-05-01T10:00:00")])
+    # 距加载时的清理不足 sweep_interval，记忆还在存储里，但读取和检索都会滤掉
+    assert "临时验证码" in memory.memories
+    assert memory.recall("临时验证码") is None
+    assert memory.get_relevant_memories("临时验证码是多少") == []
+    assert memory.recall("名字") == "小明"
+    assert memory.enforce_limits(force_sweep=True) == 1
+    assert "临时验证码" not in memory.memories
+    assert memory.eviction_stats()["expired"] == 1
@@ -0,0 +1,42 @@
+import io
+import json
+
+import pytest
+
+from memory_import import iter_json_items, iter_memory_records
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": 1.5}',
+    '{"a": 1e10, "b": {"value": "x"}}',
+    '{"a": -12.5E-3 , "b": true, "c": null}',
+    '{"键": {"value": "值", "timestamp": "2024-01-01T00:00:00"}, "b": [1, 2.5]}',
+    '{}',
+])
+def test_json_items_across_chunk_boundaries(text):
+    expected = list(json.loads(text).items())
+    for chunk_size in range(1, len(text) + 1):
+        assert list(iter_json_items(io.StringIO(text), chunk_size=chunk_size)) == expected
+
+
+@pytest.mark.parametrize("text", ['[1, 2]', '{"a" 1}', '{"a": 1 "b": 2}', '{"a": 1', '{1: 2}'])
+def test_json_items_rejects_malformed(text):
+    with pytest.raises(ValueError):
+        list(iter_json_items(io.StringIO(text), chunk_size=2))
+
+
+def test_memory_records_all_formats():
+    stamp = "2024-01-01T00:00:00"
+    sources = {
+        "json": json.dumps({"名字": {"value": "小明", "timestamp": stamp}}, ensure_ascii=False),
+        "csv": "﻿key,value,timestamp\n名字,小明,2024-01-01T00:00:00\n",
+        "txt": "名字: 小明\n没有冒号的行\n",
+    }
+    for file_format, text in sources.items():
+        stream = io.BytesIO(text.encode("utf-8"))
+        records = list(iter_memory_records(stream, file_format))
+        assert [(key, value) for key, value, _ in records] == [("名字", "小明")]
+        if file_format != "txt":
+            assert records[0][2] == stamp
+        # 调用方的流不会被关闭
+        assert not stream.closed
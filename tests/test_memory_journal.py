@@ -0,0 +1,59 @@
+import json
+import os
+
+from memory import MultiFormatMemory
+
+
+def test_remember_appends_to_log_without_rewriting_snapshots(tmp_path):
+    memory = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    memory.remember("名字", "小明")
+    memory.remember("城市", "北京")
+    assert not os.path.exists(memory.get_file_path("json"))
+    with open(memory.backend.get_log_path(), encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert [(r["op"], r["key"]) for r in records] == [("set", "名字"), ("set", "城市")]
+
+
+def test_reload_replays_sets_and_deletes(tmp_path):
+    memory = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    memory.remember("名字", "小明")
+    memory.remember("城市", "北京")
+    memory.remember("名字", "小红")
+    memory.delete("城市")
+    reloaded = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    assert reloaded.recall("名字") == "小红"
+    assert reloaded.recall("城市") is None
+
+
+def test_half_written_last_line_is_skipped(tmp_path):
+    memory = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    memory.remember("名字", "小明")
+    with open(memory.backend.get_log_path(), 'a', encoding='utf-8') as f:
+        f.write('{"op": "set", "key": "城市", "val')
+    reloaded = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    assert reloaded.recall("名字") == "小明"
+    assert "城市" not in reloaded.memories
+
+
+def test_compaction_writes_snapshots_and_truncates_log(tmp_path):
+    memory = MultiFormatMemory(str(tmp_path / "ai_memory"), compact_threshold=3)
+    for i in range(3):
+        memory.remember(f"k{i}", f"v{i}")
+    assert os.path.getsize(memory.backend.get_log_path()) == 0
+    for file_format in ("json", "csv", "txt"):
+        assert os.path.exists(memory.get_file_path(file_format))
+    with open(memory.get_file_path("json"), encoding='utf-8') as f:
+        assert set(json.load(f)) == {"k0", "k1", "k2"}
+    assert MultiFormatMemory(str(tmp_path / "ai_memory")).recall("k2") == "v2"
+
+
+def test_compaction_keeps_other_instances_journal_writes(tmp_path):
+    first = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    second = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    first.remember("名字", "小明")
+    second.remember("城市", "北京")
+    assert first.is_stale()
+    first.compact()
+    reloaded = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    assert reloaded.recall("名字") == "小明"
+    assert reloaded.recall("城市") == "北京"
@@ -0,0 +1,41 @@
+import os
+
+from memory_namespaces import MemoryNamespaces
+
+
+def make_namespaces(tmp_path, **options):
+    return MemoryNamespaces(root_dir=str(tmp_path / "memories"), default_file=str(tmp_path / "ai_memory"),
+                            **options)
+
+
+def test_namespaces_are_isolated(tmp_path):
+    namespaces = make_namespaces(tmp_path)
+    namespaces.get("alice").remember("名字", "爱丽丝")
+    assert namespaces.get("bob").recall("名字") is None
+    assert namespaces.get("alice").recall("名字") == "爱丽丝"
+
+
+def test_unsafe_ids_stay_inside_root(tmp_path):
+    namespaces = make_namespaces(tmp_path)
+    path = namespaces.shard_path("../../etc")
+    assert os.path.dirname(os.path.dirname(path)) == namespaces.root_dir
+    assert namespaces.shard_path("default") == namespaces.default_file
+
+
+def test_read_only_access_creates_nothing(tmp_path):
+    namespaces = make_namespaces(tmp_path)
+    assert len(namespaces.get("alice").memories) == 0
+    assert not os.path.exists(namespaces.root_dir)
+    namespaces.get("alice").remember("k", "v")
+    namespaces.flush()
+    assert os.listdir(namespaces.root_dir) == ["alice"]
+
+
+def test_eviction_flushes_pending_writes(tmp_path):
+    namespaces = make_namespaces(tmp_path, max_active=1, write_behind=True, flush_interval=60)
+    alice = namespaces.get("alice")
+    alice.remember("名字", "爱丽丝")
+    namespaces.get("bob")
+    assert namespaces.stats["unloads"] == 1
+    assert alice.backend.flusher is None
+    assert make_namespaces(tmp_path).get("alice").recall("名字") == "爱丽丝"
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+
+from memory_backends import FileMemoryBackend
+from memory_snapshot import iter_snapshot_records, load_snapshot, write_snapshot
+from memory_store import NO_TIMESTAMP, CompactMemoryStore, int_to_timestamp, timestamp_to_int
+
+STAMPS = [
+    "2024-05-01T12:30:45.123456",
+    "2024-05-01T12:30:45",
+    "2024-05-01T12:30:45.000000",
+    "2024-05-01T12:30:45+08:00",
+    "1970-01-01T00:00:00",
+    "不是时间",
+    "",
+]
+
+
+def test_store_round_trips_every_timestamp():
+    store = CompactMemoryStore()
+    for i, stamp in enumerate(STAMPS):
+        store.put(f"k{i}", f"v{i}", stamp)
+    assert [store[f"k{i}"]["timestamp"] for i in range(len(STAMPS))] == STAMPS
+    assert [data["timestamp"] for _, data in store.snapshot()] == STAMPS
+
+
+def test_raw_stamp_cleared_on_overwrite_and_row_reuse():
+    store = CompactMemoryStore()
+    store.put("a", "1", "不是时间")
+    store.put("a", "2", "2024-05-01T12:30:45")
+    assert store["a"]["timestamp"] == "2024-05-01T12:30:45"
+    store.put("b", "1", "2024-05-01T00:00:00.000000")
+    del store["b"]
+    store.put("c", "1", "2024-05-02T00:00:00")
+    assert store["c"]["timestamp"] == "2024-05-02T00:00:00"
+
+
+def test_missing_timestamp_sorts_first_and_differs_from_epoch():
+    assert timestamp_to_int("") == timestamp_to_int("不是时间") == NO_TIMESTAMP
+    assert timestamp_to_int("1970-01-01T00:00:00") == 0
+    assert int_to_timestamp(0) == "1970-01-01T00:00:00"
+    assert NO_TIMESTAMP < timestamp_to_int("1900-01-01T00:00:00")
+
+
+def test_aware_stamps_compare_as_local_time():
+    moment = datetime(2024, 5, 1, 4, 30, tzinfo=timezone.utc)
+    local = moment.astimezone().replace(tzinfo=None)
+    assert timestamp_to_int(moment.isoformat()) == timestamp_to_int(local.isoformat())
+    later = (local + timedelta(seconds=1)).isoformat()
+    assert timestamp_to_int(later) > timestamp_to_int(moment.isoformat())
+
+
+def test_binary_snapshot_keeps_raw_stamps(tmp_path):
+    store = CompactMemoryStore()
+    for i, stamp in enumerate(STAMPS):
+        store.put(f"k{i}", f"值{i}", stamp)
+    path = str(tmp_path / "m.bin")
+    write_snapshot(path, iter_snapshot_records(store.snapshot()), (1, 2))
+    assert load_snapshot(path, (1, 3)) is None
+    loaded = load_snapshot(path, (1, 2))
+    assert dict(loaded.items()) == dict(store.items())
+
+
+def test_compaction_preserves_timestamps(tmp_path):
+    path = str(tmp_path / "ai_memory")
+    backend = FileMemoryBackend(path, compact_store=True)
+    backend.load()
+    backend.put_many([(f"k{i}", "v", stamp) for i, stamp in enumerate(STAMPS)])
+    assert backend.compact()
+    for binary in (False, True):
+        reloaded = FileMemoryBackend(path, compact_store=True, binary_snapshot=binary)
+        assert [reloaded.load()[f"k{i}"]["timestamp"] for i in range(len(STAMPS))] == STAMPS
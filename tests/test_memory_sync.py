@@ -0,0 +1,75 @@
+import gzip
+import io
+import json
+
+from memory import MultiFormatMemory
+
+
+def make_device(tmp_path, name):
+    return MultiFormatMemory(str(tmp_path / name / "ai_memory"))
+
+
+def sync(source, target, since=None):
+    data, until = source.export_delta(since)
+    return target.import_delta(io.BytesIO(data)), until
+
+
+def test_full_export_round_trip(tmp_path):
+    laptop, phone = make_device(tmp_path, "laptop"), make_device(tmp_path, "phone")
+    laptop.put_records([("名字", "小明", "2024-05-01T10:00:00"), ("城市", "北京", "2024-05-01T10:00:01")])
+    (success, updates, deletes), _ = sync(laptop, phone)
+    assert (success, updates, deletes) == (True, 2, 0)
+    assert phone.memories["名字"] == {"value": "小明", "timestamp": "2024-05-01T10:00:00"}
+
+
+def test_since_only_exports_newer_changes(tmp_path):
+    laptop = make_device(tmp_path, "laptop")
+    laptop.put_records([("旧", "1", "2024-05-01T10:00:00"), ("新", "2", "2024-05-03T10:00:00")])
+    data, _ = laptop.export_delta("2024-05-02T00:00:00")
+    delta = json.loads(gzip.decompress(data))
+    assert list(delta["set"]) == ["新"]
+
+
+def test_last_write_wins(tmp_path):
+    laptop, phone = make_device(tmp_path, "laptop"), make_device(tmp_path, "phone")
+    laptop.put_records([("城市", "北京", "2024-05-01T10:00:00"), ("名字", "小明", "2024-05-02T10:00:00")])
+    phone.put_records([("城市", "上海", "2024-05-02T10:00:00"), ("名字", "小红", "2024-05-01T10:00:00")])
+    (_, updates, _), _ = sync(laptop, phone)
+    assert updates == 1
+    assert phone.recall("城市") == "上海"
+    assert phone.recall("名字") == "小明"
+
+
+def test_deletes_propagate_and_are_forwarded(tmp_path):
+    laptop, phone, tablet = (make_device(tmp_path, name) for name in ("laptop", "phone", "tablet"))
+    for device in (laptop, phone, tablet):
+        device.put_records([("城市", "北京", "2024-05-01T10:00:00")])
+    laptop.delete("城市")
+    (_, _, deletes), _ = sync(laptop, phone)
+    assert deletes == 1 and phone.recall("城市") is None
+    # 手机转存了删除记录，继续同步给平板
+    sync(phone, tablet)
+    assert tablet.recall("城市") is None
+    # 比删除更早的写入不会把记忆同步回来
+    tablet.put_records([("城市", "北京", "2024-05-01T10:00:00")])
+    sync(tablet, laptop)
+    assert laptop.recall("城市") is None
+
+
+def test_write_after_delete_wins(tmp_path):
+    laptop, phone = make_device(tmp_path, "laptop"), make_device(tmp_path, "phone")
+    phone.put_records([("城市", "北京", "2024-05-01T10:00:00")])
+    phone.delete("城市")
+    laptop.put_records([("城市", "上海", "2999-01-01T00:00:00")])
+    sync(laptop, phone)
+    assert phone.recall("城市") == "上海"
+
+
+def test_invalid_delta_is_rejected_whole(tmp_path):
+    phone = make_device(tmp_path, "phone")
+    bad = {"format": "ai_memory_delta", "version": 1, "set": {"名字": {"value": "小明"}, "城市": {"value": 1}},
+           "deleted": {}}
+    result = phone.import_delta(io.BytesIO(json.dumps(bad, ensure_ascii=False).encode('utf-8')))
+    assert result == (False, 0, 0)
+    assert len(phone.memories) == 0
+    assert phone.import_delta(io.BytesIO(b'{"format": "other"}')) == (False, 0, 0)
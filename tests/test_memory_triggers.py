@@ -0,0 +1,29 @@
+import pytest
+
+from memory_triggers import AhoCorasick, extract_memory_facts, find_triggers
+
+
+def test_overlapping_patterns_found_in_one_pass():
+    matcher = AhoCorasick(["he", "she", "his", "hers"])
+    found = {(start, end, matcher.patterns[index]) for start, end, index in matcher.find_all("ushers")}
+    assert found == {(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")}
+    assert [matcher.patterns[i] for _, _, i in matcher.find_leftmost_longest("ushers")] == ["she"]
+
+
+def test_longest_trigger_wins():
+    assert [trigger for trigger, _, _ in find_triggers("我不喜欢下雨")] == ["我不喜欢"]
+
+
+@pytest.mark.parametrize("text, facts", [
+    ("我的名字是小明", [("用户姓名", "小明")]),
+    ("我住在北京，我的生日是5月1日", [("用户住址", "北京"), ("用户生日", "5月1日")]),
+    ("记住我是程序员", [("我", "程序员")]),
+    ("记住 我是程序员，我喜欢猫", [("我", "程序员"), ("用户喜好", "猫")]),
+    ("我的名字是小明，我是程序员", [("用户姓名", "小明")]),
+    ("我喜欢猫，我不喜欢狗", [("用户喜好", "猫")]),
+    ("记一下密码是1234。今天天气不错", [("密码", "1234")]),
+    ("我是学生", []),
+    ("今天天气不错", []),
+])
+def test_extract_memory_facts(text, facts):
+    assert extract_memory_facts(text) == facts
@@ -0,0 +1,33 @@
+from response_cache import ResponseCache
+
+HISTORY = [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "你好呀"}]
+
+
+def test_key_normalizes_question():
+    key = ResponseCache.make_key("今天  天气\n怎么样", ["城市: 北京"], "系统", HISTORY)
+    assert key == ResponseCache.make_key(" 今天 天气 怎么样 ", ["城市: 北京"], "系统", HISTORY)
+
+
+def test_key_depends_on_context():
+    key = ResponseCache.make_key("我叫什么", [], "系统", HISTORY)
+    assert key != ResponseCache.make_key("我叫什么", ["姓名: 小明"], "系统", HISTORY)
+    assert key != ResponseCache.make_key("我叫什么", [], "系统（含摘要）", HISTORY)
+    assert key != ResponseCache.make_key("我叫什么", [], "系统", HISTORY + [{"role": "user", "content": "我叫小红"}])
+
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path))
+    key = ResponseCache.make_key("问题", [], "系统")
+    assert cache.get(key) is None
+    cache.put(key, "回复")
+    assert cache.get(key) == "回复"
+    # 新实例只能从磁盘读到
+    assert ResponseCache(cache_dir=str(tmp_path)).get(key) == "回复"
+    assert cache.stats["memory_hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path), ttl=-1)
+    cache.put("k", "回复")
+    assert cache.get("k") is None
+    assert not any(tmp_path.iterdir())
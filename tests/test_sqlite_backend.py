@@ -0,0 +1,50 @@
+from memory import MultiFormatMemory
+from memory_backends import SQLiteMemoryBackend
+
+
+def open_pair(tmp_path):
+    path = str(tmp_path / "ai_memory.db")
+    return SQLiteMemoryBackend(path), SQLiteMemoryBackend(path)
+
+
+def test_own_writes_are_not_stale(tmp_path):
+    backend, _ = open_pair(tmp_path)
+    backend.load()
+    backend.put_many([("名字", "小明", "")])
+    backend.delete("名字")
+    assert not backend.is_stale()
+
+
+def test_other_connection_write_is_stale_until_reload(tmp_path):
+    backend, other = open_pair(tmp_path)
+    backend.load()
+    other.put_many([("城市", "北京", "")])
+    assert backend.is_stale()
+    generation = backend.generation
+    backend.load()
+    assert not backend.is_stale()
+    assert backend.generation == generation + 1
+
+
+def test_write_after_outside_change_reloads_in_place(tmp_path):
+    backend, other = open_pair(tmp_path)
+    memories = backend.load()
+    other.put_many([("城市", "北京", "")])
+    generation = backend.generation
+    backend.put_many([("名字", "小明", "")])
+    assert backend.generation == generation + 1
+    assert not backend.is_stale()
+    assert set(memories) == {"城市", "名字"}
+
+
+def test_memory_rebuilds_semantic_index_after_outside_write(tmp_path):
+    path = str(tmp_path / "ai_memory.db")
+    memory = MultiFormatMemory(str(tmp_path / "ai_memory"), backend=SQLiteMemoryBackend(path))
+    other = MultiFormatMemory(str(tmp_path / "ai_memory"), backend=SQLiteMemoryBackend(path))
+    memory.remember("名字", "小明")
+    memory.get_relevant_memories("名字", retrieval="semantic")
+    other.remember("最喜欢的城市", "北京")
+    assert memory.is_stale()
+    memory.remember("生日", "五月")
+    relevant = memory.get_relevant_memories("最喜欢的城市", retrieval="semantic")
+    assert any("北京" in line for line in relevant)
@@ -0,0 +1,45 @@
+import json
+import os
+import time
+
+from memory import MultiFormatMemory
+
+
+def read_log(memory):
+    with open(memory.backend.get_log_path(), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_writes_coalesce_into_one_flush(tmp_path):
+    memory = MultiFormatMemory(str(tmp_path / "ai_memory"), write_behind=True, flush_interval=60)
+    for i in range(5):
+        memory.remember(f"k{i}", f"v{i}")
+    # 改动先只在内存里，读取立即可见
+    assert memory.recall("k4") == "v4"
+    assert not os.path.exists(memory.backend.get_log_path())
+    memory.flush()
+    assert [r["key"] for r in read_log(memory)] == [f"k{i}" for i in range(5)]
+    stats = memory.backend.write_stats
+    assert (stats["mutations"], stats["flushes"], stats["coalesced_writes"]) == (5, 1, 4)
+    memory.backend.close()
+
+
+def test_background_thread_flushes_after_interval(tmp_path):
+    memory = MultiFormatMemory(str(tmp_path / "ai_memory"), write_behind=True, flush_interval=0.05)
+    memory.remember("名字", "小明")
+    deadline = time.monotonic() + 5
+    while memory.backend.flusher is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [r["key"] for r in read_log(memory)] == ["名字"]
+    memory.backend.close()
+
+
+def test_close_flushes_pending_changes(tmp_path):
+    memory = MultiFormatMemory(str(tmp_path / "ai_memory"), write_behind=True, flush_interval=60)
+    memory.remember("名字", "小明")
+    memory.delete("名字")
+    memory.remember("城市", "北京")
+    memory.backend.close()
+    reloaded = MultiFormatMemory(str(tmp_path / "ai_memory"))
+    assert reloaded.recall("城市") == "北京"
+    assert reloaded.recall("名字") is None
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# 直方图桶上限（秒），覆盖从微秒级的记忆检索到十几秒的 API 调用
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 调试面板里各阶段的显示名
+STAGE_LABELS = {
+    "memory_load": "加载记忆",
+    "memory_save": "保存记忆",
+    "memory_lookup": "检索相关记忆",
+    "prompt_build": "构建提示词",
+    "api_call": "API 调用（不含渲染）",
+    "render": "渲染回复",
+    "ttft": "首字延迟",
+    "total": "总耗时",
+}
+
+
+# === 单轮对话计时 ===
+class TurnTimer:
+    """记录一轮对话中各阶段的耗时（秒），同名阶段多次出现时累加"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def mark(self, stage):
+        """记录从本轮开始到现在的时间（只记第一次），例如首字延迟"""
+        self.spans.setdefault(stage, time.perf_counter() - self.start)
+
+    def finish(self):
+        """记录总耗时并返回全部阶段"""
+        self.spans["total"] = time.perf_counter() - self.start
+        self.spans.setdefault("ttft", self.spans["total"])
+        return self.spans
+
+
+# === 指标导出：JSON 行 + Prometheus 文本格式 ===
+class MetricsRecorder:
+    """进程内汇总各阶段耗时
+
+    每轮对话（或单独的记忆加载/保存）写一行 JSON 到 jsonl_path，
+    同时维护每个阶段的直方图，并以 Prometheus 文本格式原子地重写 prom_path，
+    可由 node_exporter 的 textfile collector 采集。
+    """
+
+    def __init__(self, metrics_dir="metrics", buckets=DEFAULT_BUCKETS, max_log_bytes=10 * 1024 * 1024):
+        self.metrics_dir = metrics_dir
+        self.jsonl_path = os.path.join(metrics_dir, "turns.jsonl")
+        self.prom_path = os.path.join(metrics_dir, "metrics.prom")
+        self.buckets = tuple(buckets)
+        # JSON 行文件超过这个大小时轮转为 turns.jsonl.1
+        self.max_log_bytes = max_log_bytes
+        # 阶段 -> [各桶计数, 总和, 次数]
+        self.histograms = {}
+        self.lock = threading.Lock()
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    def observe(self, stage, seconds):
+        """把一次耗时计入阶段直方图（调用方持有锁）"""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = [[0] * len(self.buckets), 0.0, 0]
+        counts = histogram[0]
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                counts[i] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    def record(self, spans, kind="turn", **fields):
+        """记录一组阶段耗时（秒）：更新直方图、追加 JSON 行并刷新 Prometheus 文件"""
+        line = {
+            "time": datetime.now().isoformat(),
+            "kind": kind,
+            **fields,
+            "spans_ms": {stage: round(seconds * 1000, 3) for stage, seconds in spans.items()},
+        }
+        with self.lock:
+            for stage, seconds in spans.items():
+                self.observe(stage, seconds)
+            try:
+                self.append_line(line)
+                self.write_prometheus()
+            except OSError as e:
+                print(f"写入耗时指标失败: {e}")
+
+    @contextmanager
+    def timed(self, stage, **fields):
+        """单独计时一个阶段（不属于某一轮对话时使用，例如页面重跑时加载记忆）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record({stage: time.perf_counter() - start}, kind="event", **fields)
+
+    def append_line(self, line):
+        try:
+            if os.path.getsize(self.jsonl_path) >= self.max_log_bytes:
+                os.replace(self.jsonl_path, self.jsonl_path + ".1")
+        except OSError:
+            pass
+        with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def render_prometheus(self):
+        """直方图的 Prometheus 文本格式"""
+        lines = [
+            "# HELP chat_stage_seconds Latency of each stage in a chat turn.",
+            "# TYPE chat_stage_seconds histogram",
+        ]
+        for stage in sorted(self.histograms):
+            counts, total, count = self.histograms[stage]
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'chat_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+            lines.append(f'chat_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'chat_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'chat_stage_seconds_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        # 先写临时文件再重命名，采集端不会读到写了一半的文件
+        tmp_path = f"{self.prom_path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, self.prom_path)
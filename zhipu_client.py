@@ -0,0 +1,245 @@
+import asyncio
+import json
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 异步客户端用 tornado（随 streamlit 一起安装），只有 HTTP 服务模式需要
+try:
+    from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+except ImportError:
+    AsyncHTTPClient = None
+
+ZHIPU_API_URL = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+ZHIPU_MODEL = "glm-4-flash"
+
+# 这些状态码说明服务端暂时不可用，值得退避重试
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# === 智谱AI接口客户端（连接池 + 超时 + 重试） ===
+class ZhipuClient:
+    def __init__(self, api_key, api_url=ZHIPU_API_URL, model=ZHIPU_MODEL,
+                 connect_timeout=5, read_timeout=60, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, pool_size=10):
+        self.api_url = api_url
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # 复用同一个 Session，连接保持长连接，避免每条消息重新握手
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """计算第 attempt 次重试前的等待时间（指数退避 + 全抖动）"""
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, payload, stream=False):
+        """发送请求，遇到 429/5xx 或连接失败时退避重试，返回最后一次响应"""
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.api_url, json=payload,
+                                             timeout=self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+                time.sleep(self.backoff_delay(attempt, retry_after))
+                attempt += 1
+                continue
+            return response
+
+    def chat(self, messages, on_delta=None):
+        """发送对话，返回 (完整回复, 状态)；传入 on_delta 时使用流式输出"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": on_delta is not None
+        }
+        try:
+            if on_delta is None:
+                response = self.post(payload)
+                if response.status_code != 200:
+                    return f"API请求失败: {response.status_code} {response.text}", "error"
+                return response.json()["choices"][0]["message"]["content"], "success"
+
+            # 流式输出：逐行解析 SSE，"data: [DONE]" 表示结束
+            parts = []
+            with self.post(payload, stream=True) as response:
+                if response.status_code != 200:
+                    return f"API请求失败: {response.status_code} {response.text}", "error"
+                for line in response.iter_lines():
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        on_delta(delta)
+            return "".join(parts), "success"
+        except requests.exceptions.RequestException as e:
+            return f"网络请求异常: {e}", "error"
+        except (ValueError, KeyError, IndexError) as e:
+            return f"解析API响应失败: {e}", "error"
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+
+class StreamParser:
+    """逐块解析 SSE 响应体；状态码不是 200 时原样收集响应体用于报错"""
+
+    def __init__(self, on_delta):
+        self.on_delta = on_delta
+        self.reset()
+
+    def reset(self):
+        """重试前清空上一次响应的内容"""
+        self.status = None
+        self.buffer = b""
+        self.error_body = []
+        self.parts = []
+        self.done = False
+
+    def on_header(self, line):
+        # 第一行是状态行，例如 "HTTP/1.1 200 OK"
+        if self.status is None and line.startswith("HTTP/"):
+            self.status = int(line.split()[1])
+
+    def on_chunk(self, chunk):
+        if self.status != 200:
+            self.error_body.append(chunk)
+            return
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            line = line.strip()
+            if self.done or not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                self.done = True
+                continue
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                self.parts.append(delta)
+                self.on_delta(delta)
+
+
+# === 智谱AI异步客户端（HTTP 服务模式，单进程承载大量并发会话） ===
+class AsyncZhipuClient(ZhipuClient):
+    """ZhipuClient 的协程版本：同样的超时、退避重试和返回值，等待响应时不占线程
+
+    装有 pycurl 时使用 curl 客户端以复用长连接，否则用 tornado 自带的客户端。
+    """
+
+    def __init__(self, api_key, api_url=ZHIPU_API_URL, model=ZHIPU_MODEL,
+                 connect_timeout=5, read_timeout=60, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, pool_size=10):
+        if AsyncHTTPClient is None:
+            raise RuntimeError("异步客户端需要安装 tornado")
+        self.api_url = api_url
+        self.model = model
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        try:
+            import pycurl  # noqa: F401
+            AsyncHTTPClient.configure("tornado.curl_httpclient.CurlAsyncHTTPClient")
+        except ImportError:
+            pass
+        # force_instance：不同密钥的客户端各用一个连接池，关闭时互不影响
+        self.http = AsyncHTTPClient(force_instance=True, max_clients=pool_size)
+
+    async def post(self, payload, parser=None):
+        """发送请求，遇到 429/5xx 或连接失败时退避重试；流式请求开始输出后不再重试"""
+        attempt = 0
+        while True:
+            request = HTTPRequest(
+                self.api_url, method="POST", headers=self.headers,
+                body=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                connect_timeout=self.connect_timeout, request_timeout=self.read_timeout,
+                header_callback=parser.on_header if parser else None,
+                streaming_callback=parser.on_chunk if parser else None
+            )
+            try:
+                response = await self.http.fetch(request, raise_error=False)
+            except (HTTPClientError, OSError):
+                # 超时（599）或连接失败
+                if attempt >= self.max_retries or (parser and parser.parts):
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt))
+                attempt += 1
+                if parser:
+                    parser.reset()
+                continue
+
+            if response.code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                await asyncio.sleep(self.backoff_delay(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+                if parser:
+                    parser.reset()
+                continue
+            return response
+
+    async def chat(self, messages, on_delta=None):
+        """发送对话，返回 (完整回复, 状态)；传入 on_delta 时使用流式输出"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": on_delta is not None
+        }
+        try:
+            if on_delta is None:
+                response = await self.post(payload)
+                if response.code != 200:
+                    return f"API请求失败: {response.code} {response.body.decode('utf-8', 'replace')}", "error"
+                return json.loads(response.body)["choices"][0]["message"]["content"], "success"
+
+            parser = StreamParser(on_delta)
+            response = await self.post(payload, parser)
+            if response.code != 200:
+                body = b"".join(parser.error_body).decode('utf-8', 'replace')
+                return f"API请求失败: {response.code} {body}", "error"
+            # 最后一行可能没有换行符
+            parser.on_chunk(b"\n")
+            return "".join(parser.parts), "success"
+        except (HTTPClientError, OSError) as e:
+            return f"网络请求异常: {e}", "error"
+        except (ValueError, KeyError, IndexError) as e:
+            return f"解析API响应失败: {e}", "error"
+
+    def close(self):
+        self.http.close()